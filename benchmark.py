@@ -0,0 +1,297 @@
+import argparse
+from datetime import datetime
+import glob
+import os
+import time
+from urllib.parse import unquote, urlparse
+from zoneinfo import ZoneInfo
+
+import numpy as np
+
+from config import load_config
+import headless
+from layout import Layout
+import main
+from sprites import Frame, FrameRenderer
+
+
+# Times the arrival pipeline and the renderer offline, against feeds recorded with --record and a
+# canvas that never touches a panel:
+#
+#   python benchmark.py --record           # save the live F, G and R feeds to ./fixtures
+#   python benchmark.py --synthetic        # or write the small made up ones that ship in ./fixtures
+#   python benchmark.py                    # the stops in config.json
+#   python benchmark.py --stops 300        # the 300 busiest stops in the recordings
+#
+# Recorded feeds are shifted so they look like they were generated just now, otherwise every stop
+# would fail the stale data check in draw_trains and we'd only ever time '*no data*'.
+
+RECORD_ROUTES = ('F', 'G', 'R')
+PERCENTILES = (50, 90, 99)
+
+# the made up feeds, generated at 08:15 on Tuesday 5 March 2024 in New York. feed id -> (route,
+# its stops southbound) for the routes in it, so every configured stop has trains
+SYNTHETIC_TIMESTAMP = 1709644500
+SYNTHETIC_FEEDS = {
+    'gtfs-bdfm': (('F', ('F20', 'F21', 'F22', 'F23', 'F24', 'F25', 'F26', 'F27')),
+                  ('D', ('R31', 'R32', 'R33', 'R34', 'R35', 'R36'))),
+    'gtfs-g': (('G', ('F20', 'F21', 'F22', 'F23', 'F24', 'F25', 'F26', 'F27')),),
+    'gtfs-nqrw': (('R', ('R20', 'R21', 'R22', 'R23', 'R24', 'R25', 'R26', 'R27', 'R28', 'R29', 'R30', 'R31',
+                         'R32', 'R33', 'R34')),
+                  ('N', ('R20', 'R21', 'R22', 'R23', 'Q01', 'R30', 'R31', 'R32', 'R33', 'R34'))),
+}
+# trains each way on every route, SYNTHETIC_HEADWAY seconds apart, SYNTHETIC_HOP between stops
+SYNTHETIC_TRAINS = 4
+SYNTHETIC_HEADWAY = 420
+SYNTHETIC_HOP = 90
+
+
+def feed_url(feed_id):
+    # the realtime feed a fixture was recorded from, e.g. gtfs-bdfm
+    for url in main.lazy_import('nyct_gtfs').NYCTFeed._train_to_url.values():
+        if unquote(urlparse(url).path).split('/')[-1] == feed_id:
+            return url
+    raise ValueError(f'Unknown feed {feed_id}')
+
+
+def record(fixtures_dir):
+    os.makedirs(fixtures_dir, exist_ok=True)
+    NYCTFeed = main.lazy_import('nyct_gtfs').NYCTFeed
+    for url in sorted({NYCTFeed._train_to_url[route] for route in RECORD_ROUTES}):
+        response = main.get_fetch_engine().get(url)
+        response.raise_for_status()
+        path = os.path.join(fixtures_dir, unquote(urlparse(url).path).split('/')[-1] + '.pb')
+        with open(path, 'wb') as fp:
+            fp.write(response.content)
+        print(f'Recorded {len(response.content)} bytes to {path}')
+
+
+def synthetic_feed(routes, timestamp=SYNTHETIC_TIMESTAMP):
+    # a feed of SYNTHETIC_TRAINS trains each way on each route, the first of them due at its last
+    # stop about now and the later ones yet to leave their terminal, so with no VehiclePosition
+    gtfs_realtime_pb2 = main.lazy_import('nyct_gtfs.compiled_gtfs.gtfs_realtime_pb2')
+    nyct_subway_pb2 = main.lazy_import('nyct_gtfs.compiled_gtfs.nyct_subway_pb2')
+    message = gtfs_realtime_pb2.FeedMessage()
+    message.header.gtfs_realtime_version = '1.0'
+    message.header.timestamp = timestamp
+
+    for route_ind, (route_id, stops) in enumerate(routes):
+        for direction, direction_stops in (('S', stops), ('N', stops[::-1])):
+            for train_ind in range(SYNTHETIC_TRAINS):
+                # routes in one feed don't all arrive on the same minute
+                start = (timestamp - SYNTHETIC_HOP * (len(stops) - 1) +
+                         SYNTHETIC_HEADWAY * train_ind + 150 * route_ind + (60 if direction == 'N' else 0))
+                origin = datetime.fromtimestamp(start, ZoneInfo(main.FIXTURES_TZ))
+                trip_update = message.entity.add(id=f'{route_id}{direction}{train_ind}').trip_update
+                trip_update.trip.trip_id = f'{(origin.hour * 60 + origin.minute) * 100:06d}_{route_id}..{direction}'
+                trip_update.trip.route_id = route_id
+                trip_update.trip.start_date = origin.strftime('%Y%m%d')
+                descriptor = trip_update.trip.Extensions[nyct_subway_pb2.nyct_trip_descriptor]
+                descriptor.train_id = f'0{route_id} {origin:%H%M} {direction_stops[0]}/{direction_stops[-1]}'
+                descriptor.is_assigned = True
+                for stop_ind, stop_id in enumerate(direction_stops):
+                    if start + SYNTHETIC_HOP * stop_ind < timestamp:
+                        # the live feeds drop the stops a train has passed
+                        continue
+                    stu = trip_update.stop_time_update.add(stop_id=stop_id + direction)
+                    stu.arrival.time = start + SYNTHETIC_HOP * stop_ind
+                    stu.departure.time = start + SYNTHETIC_HOP * stop_ind + 30
+
+                if start <= timestamp:
+                    vehicle = message.entity.add(id=f'{route_id}{direction}{train_ind}v').vehicle
+                    vehicle.trip.CopyFrom(trip_update.trip)
+                    vehicle.timestamp = timestamp - 20
+                    vehicle.stop_id = trip_update.stop_time_update[0].stop_id
+                    vehicle.current_status = gtfs_realtime_pb2.VehiclePosition.IN_TRANSIT_TO
+    return message.SerializeToString()
+
+
+def write_synthetic(fixtures_dir):
+    os.makedirs(fixtures_dir, exist_ok=True)
+    for feed_id, routes in SYNTHETIC_FEEDS.items():
+        content = synthetic_feed(routes)
+        path = os.path.join(fixtures_dir, f'{feed_id}.pb')
+        with open(path, 'wb') as fp:
+            fp.write(content)
+        print(f'Wrote {len(content)} bytes to {path}')
+
+
+def shift_feed(content, now):
+    # moves every timestamp in a feed by the same amount, so it was generated at now
+    gtfs_realtime_pb2 = main.lazy_import('nyct_gtfs.compiled_gtfs.gtfs_realtime_pb2')
+    message = gtfs_realtime_pb2.FeedMessage()
+    message.ParseFromString(content)
+    offset = int(now.timestamp()) - message.header.timestamp
+
+    message.header.timestamp += offset
+    for entity in message.entity:
+        if entity.HasField('trip_update'):
+            if entity.trip_update.timestamp:
+                entity.trip_update.timestamp += offset
+            for stu in entity.trip_update.stop_time_update:
+                if stu.HasField('arrival') and stu.arrival.time:
+                    stu.arrival.time += offset
+                if stu.HasField('departure') and stu.departure.time:
+                    stu.departure.time += offset
+        elif entity.HasField('vehicle') and entity.vehicle.timestamp:
+            entity.vehicle.timestamp += offset
+    return message.SerializeToString()
+
+
+def load_fixtures(fixtures_dir):
+    # [(feed url, feed bytes)]
+    paths = sorted(glob.glob(os.path.join(fixtures_dir, '*.pb')))
+    if not paths:
+        raise SystemExit(f'No recorded feeds in {fixtures_dir}, run with --record or --synthetic first')
+
+    now = datetime.now()
+    fixtures = []
+    for path in paths:
+        with open(path, 'rb') as fp:
+            fixtures.append((feed_url(os.path.basename(path)[:-len('.pb')]), shift_feed(fp.read(), now)))
+    return fixtures
+
+
+def busiest_stops(feed_trips, num_stops):
+    # the stops with the most arrivals in the recordings
+    counts = {}
+    for trips in feed_trips:
+        for train in trips:
+            for stu in train.stop_time_updates:
+                counts[stu.stop_id] = counts.get(stu.stop_id, 0) + 1
+    return sorted(counts, key=lambda stop_id: (-counts[stop_id], stop_id))[:num_stops]
+
+
+def timed(fn, *args):
+    # (seconds, result)
+    start = time.perf_counter()
+    result = fn(*args)
+    return time.perf_counter() - start, result
+
+
+def report(name, seconds):
+    seconds = np.asarray(seconds) * 1000
+    percentiles = ' '.join(f'p{p}={value:8.3f}' for p, value in zip(PERCENTILES, np.percentile(seconds, PERCENTILES)))
+    print(f'  {name: <28s} {percentiles} max={seconds.max():8.3f}ms  (n={len(seconds)})')
+
+
+def benchmark_pipeline(fixtures, num_stops, depth, repeat):
+    feeds = [main.new_nyct_feed(url) for url, _ in fixtures]
+
+    parse_times = []
+    trips_times = []
+    for _ in range(repeat):
+        for feed, (_, content) in zip(feeds, fixtures):
+            parse_times.append(timed(feed.load_gtfs_bytes, content)[0])
+            seconds, trips = timed(lambda: tuple(feed.trips))
+            trips_times.append(seconds)
+    feed_trips = tuple(tuple(feed.trips) for feed in feeds)
+    print(f'{len(fixtures)} feeds, {sum(len(content) for _, content in fixtures)} bytes, '
+          f'{sum(len(trips) for trips in feed_trips)} trips')
+    report('parse protobuf', parse_times)
+    report('build Trip objects', trips_times)
+
+    if num_stops is None:
+        stop_ids = list(load_config().stop_ids)
+    else:
+        stop_ids = busiest_stops(feed_trips, num_stops)
+    feed_stop_ids = [frozenset(stop_ids)] * len(feed_trips)
+    index_times = [timed(main.build_arrival_index, feed_trips, depth, feed_stop_ids)[0] for _ in range(repeat)]
+    print(f'{len(stop_ids)} stops, {depth} arrivals each')
+    report('build_arrival_index', index_times)
+
+    # the same feeds parsed again, as when the MTA republishes them with only a new header timestamp
+    index = main.ArrivalIndex(depth)
+    for feed_ind, trips in enumerate(feed_trips):
+        index.update(feed_ind, trips, feed_stop_ids[feed_ind])
+    update_times = []
+    for _ in range(repeat):
+        for feed_ind, (feed, (_, content)) in enumerate(zip(feeds, fixtures)):
+            feed.load_gtfs_bytes(content)
+            update_times.append(timed(index.update, feed_ind, tuple(feed.trips), feed_stop_ids[feed_ind])[0])
+    report('ArrivalIndex.update, same', update_times)
+
+    main.SNAPSHOT = main.FeedSnapshot(timestamp=datetime.now(),
+                                      arrivals=main.build_arrival_index(feed_trips, depth, feed_stop_ids))
+    all_trips = [train for trips in feed_trips for train in trips]
+    query_times = []
+    unindexed_times = []
+    arrival_time_times = []
+    for _ in range(repeat):
+        for stop_id in stop_ids:
+            query_times.append(timed(main.get_next_trains, depth, stop_id)[0])
+            unindexed_times.append(timed(main.find_next_trains, all_trips, depth, stop_id)[0])
+            arrival_time_times.append(timed(lambda: [main.arrival_time(train, stop_id) for train in all_trips])[0])
+    report('get_next_trains per stop', query_times)
+    report('find_next_trains per stop', unindexed_times)
+    report('arrival_time, all trips', arrival_time_times)
+    return stop_ids
+
+
+def benchmark_render(stop_ids, num_frames, width, height):
+    display = main.DisplayTrains(list(stop_ids))
+    display.args = display.parser.parse_args([])
+    display.config = load_config(display.args.config, stop_ids)
+    options = headless.RGBMatrixOptions()
+    options.rows = height
+    options.cols = width
+    display.matrix = headless.RGBMatrix(options=options)
+    display.renderer = FrameRenderer(display.matrix)
+    display.scheduler = main.SingleFrameScheduler()
+    display.layout = Layout(width, height, stop_ids)
+    display.num_rows = display.layout.num_rows
+    canvas = display.matrix.CreateFrameCanvas()
+
+    draw_times = []
+    show_times = []
+    for frame_ind in range(num_frames):
+        # a different page every frame, so nothing is skipped as unchanged
+        page = display.layout.pages[frame_ind % len(display.layout.pages)]
+        seconds, frame = timed(display.draw_page, page, Frame())
+        draw_times.append(seconds)
+        seconds, canvas = timed(display.renderer.show, canvas, frame)
+        show_times.append(seconds)
+        if len(display.layout.pages) == 1:
+            # only one page, redraw it all every frame
+            display.renderer.invalidate()
+    print(f'{num_frames} frames at {width}x{height}, {len(display.layout.pages[0])} stops a page, '
+          f'{display.matrix.swaps} swapped')
+    report('draw_page', draw_times)
+    report('FrameRenderer.show', show_times)
+
+    clock_times = []
+    for _ in range(num_frames):
+        # a full redraw every time, the clock alone would mostly be skipped as unchanged
+        display.renderer.invalidate()
+        seconds, canvas = timed(display.display_clock, canvas)
+        clock_times.append(seconds)
+    report('display_clock', clock_times)
+
+
+def main_benchmark():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--fixtures', default=main.FIXTURES_DIR, help='Folder of recorded feeds. Default: ./fixtures')
+    parser.add_argument('--record', action='store_true', help='Record the live F, G and R feeds to --fixtures and exit')
+    parser.add_argument('--synthetic', action='store_true', help='Write made up F, G and R feeds to --fixtures and exit')
+    parser.add_argument('--stops', type=int, help='Benchmark the N busiest stops instead of the configured ones')
+    parser.add_argument('--depth', type=int, default=2, help='Arrivals kept per stop. Default: 2')
+    parser.add_argument('--repeat', type=int, default=20, help='Times each pipeline stage is run. Default: 20')
+    parser.add_argument('--frames', type=int, default=500, help='Frames rendered. Default: 500')
+    parser.add_argument('--width', type=int, default=64, help='Canvas width. Default: 64')
+    parser.add_argument('--height', type=int, default=32, help='Canvas height. Default: 32')
+    args = parser.parse_args()
+
+    if args.record:
+        record(args.fixtures)
+        return
+    if args.synthetic:
+        write_synthetic(args.fixtures)
+        return
+
+    fixtures = load_fixtures(args.fixtures)
+    stop_ids = benchmark_pipeline(fixtures, args.stops, args.depth, args.repeat)
+    benchmark_render(stop_ids, args.frames, args.width, args.height)
+
+
+if __name__ == '__main__':
+    main_benchmark()
@@ -0,0 +1,48 @@
+import argparse
+import csv
+import os
+
+
+# Regenerates gtfs/stop_routes.csv from the MTA static GTFS
+# (http://web.mta.info/developers/data/nyct/subway/google_transit.zip), unzip it and point this at the folder.
+# main.py uses the file to work out which realtime feeds serve the stops it is showing.
+
+
+def build_stop_routes(gtfs_dir):
+    with open(os.path.join(gtfs_dir, 'trips.txt'), newline='') as fp:
+        trip_routes = {row['trip_id']: row['route_id'] for row in csv.DictReader(fp)}
+
+    with open(os.path.join(gtfs_dir, 'stops.txt'), newline='') as fp:
+        stops = list(csv.DictReader(fp))
+    parents = {stop['stop_id']: stop['parent_station'] or stop['stop_id'] for stop in stops}
+    names = {stop['stop_id']: stop['stop_name'] for stop in stops}
+
+    stop_routes = {}
+    with open(os.path.join(gtfs_dir, 'stop_times.txt'), newline='') as fp:
+        for row in csv.DictReader(fp):
+            route_id = trip_routes.get(row['trip_id'])
+            if route_id is None:
+                continue
+            parent = parents.get(row['stop_id'], row['stop_id'])
+            stop_routes.setdefault(parent, set()).add(route_id)
+
+    return [(stop_id, names.get(stop_id, ''), ' '.join(sorted(routes)))
+            for stop_id, routes in sorted(stop_routes.items())]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('gtfs_dir', help='Folder holding the unzipped static GTFS')
+    parser.add_argument('-o', '--output', default='./gtfs/stop_routes.csv')
+    args = parser.parse_args()
+
+    rows = build_stop_routes(args.gtfs_dir)
+    with open(args.output, 'w', newline='') as fp:
+        writer = csv.writer(fp)
+        writer.writerow(['stop_id', 'stop_name', 'routes'])
+        writer.writerows(rows)
+    print(f'Wrote {len(rows)} stops to {args.output}')
+
+
+if __name__ == '__main__':
+    main()
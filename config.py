@@ -0,0 +1,111 @@
+import csv
+from datetime import time as dt_time
+import json
+import warnings
+
+# The stops, names, route colours, screen schedule and dwell times main.py shows, read from
+# config.json and compiled once at startup into the lookup tables the display loop uses.
+# Anything a stop doesn't set comes from the packaged static GTFS in STOP_ROUTES_FILE.
+
+CONFIG_FILE = './config.json'
+# which routes stop at each station, see build_stop_routes.py
+STOP_ROUTES_FILE = './gtfs/stop_routes.csv'
+
+DIRECTION_ARROWS = {'N': '↑', 'S': '↓'}
+
+# seconds each screen stays up, trains is per page of stops
+DEFAULT_DWELL_TIMES = {
+    'trains': 10,
+    'clock': 10,
+    'weather': 10,
+    'off': 600,
+}
+SCREENS = frozenset(DEFAULT_DWELL_TIMES)
+
+
+def station_id(stop_id):
+    # platform ids are the station id plus N or S
+    return stop_id[:-1] if stop_id[-1] in 'NS' else stop_id
+
+
+def stop_direction(stop_id):
+    return 'N' if stop_id.endswith('N') else 'S'
+
+
+def load_stations(path=STOP_ROUTES_FILE):
+    # station_id -> (name, routes)
+    with open(path, newline='') as fp:
+        return {row['stop_id']: (row['stop_name'], tuple(row['routes'].split())) for row in csv.DictReader(fp)}
+
+
+def parse_time(value):
+    # 'HH:MM', '24:00' being the end of the day
+    hours, minutes = (int(field) for field in value.split(':'))
+    if (hours, minutes) == (24, 0):
+        return None
+    return dt_time(hours, minutes)
+
+
+class Config:
+    def __init__(self, settings, stations, stop_ids=None):
+        stop_settings = {stop['stop_id']: stop for stop in settings.get('stops', [])}
+        if stop_ids is None:
+            stop_ids = [stop['stop_id'] for stop in settings.get('stops', [])]
+        self.stop_ids = tuple(stop_ids)
+        if not self.stop_ids:
+            raise ValueError('No stops configured')
+
+        self.text_colour = tuple(settings['text_colour'])
+        self.text_colour_arriving = tuple(settings['text_colour_arriving'])
+        self.default_route_colour = tuple(settings['default_route_colour'])
+        # route_id -> (r, g, b), each group of routes sharing a colour is written as e.g. "B D F M"
+        self.route_colours = {}
+        for routes, colour in settings['route_colours'].items():
+            for route in routes.split():
+                self.route_colours[route] = tuple(colour)
+
+        # stop_id -> header text, direction and the routes in the header
+        self.stop_titles = {}
+        self.stop_directions = {}
+        self.stop_routes = {}
+        for stop_id in self.stop_ids:
+            stop = stop_settings.get(stop_id, {})
+            station_name, station_routes = stations.get(station_id(stop_id), (None, ()))
+            name = stop.get('name', station_name)
+            if name is None:
+                warnings.warn(f'No name known for {stop_id}')
+                name = station_id(stop_id)
+            direction = stop_direction(stop_id)
+            self.stop_titles[stop_id] = f'{name} {DIRECTION_ARROWS[direction]}'
+            self.stop_directions[stop_id] = direction
+            self.stop_routes[stop_id] = tuple(stop.get('routes', station_routes))
+
+        # (start, end, screens) in order, an end of None is midnight
+        self.schedule = []
+        for entry in settings.get('schedule', []):
+            screens = tuple(entry['screens'])
+            unknown = set(screens) - SCREENS
+            if unknown:
+                raise ValueError(f'Unknown screens {sorted(unknown)} in schedule')
+            self.schedule.append((parse_time(entry['from']), parse_time(entry['to']), screens))
+        self.default_screens = tuple(settings.get('otherwise', ['off']))
+        if set(self.default_screens) - SCREENS:
+            raise ValueError(f'Unknown screens {sorted(set(self.default_screens) - SCREENS)} otherwise')
+
+        self.dwell_times = dict(DEFAULT_DWELL_TIMES, **settings.get('dwell_times', {}))
+
+    def route_colour(self, route_id):
+        return self.route_colours.get(route_id, self.default_route_colour)
+
+    def screens_at(self, timestamp):
+        for start, end, screens in self.schedule:
+            if start <= timestamp and (end is None or timestamp < end):
+                return screens
+        return self.default_screens
+
+
+def load_config(path=CONFIG_FILE, stop_ids=None, stations_path=STOP_ROUTES_FILE):
+    # stop_ids shows those stops instead of the configured ones, still using any settings for them
+    with open(path) as fp:
+        settings = json.load(fp)
+    return Config(settings, load_stations(stations_path), stop_ids)
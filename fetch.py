@@ -0,0 +1,207 @@
+import asyncio
+from collections import deque, namedtuple
+import threading
+import time
+from urllib.parse import urlparse
+
+import httpx
+
+from metrics import METRICS
+
+# One pooled, keep-alive HTTP client for everything we fetch (the MTA feeds and OpenWeatherMap),
+# running on an asyncio loop in its own thread. A batch of requests is fetched concurrently, so a
+# refresh takes as long as the slowest feed rather than the sum of them.
+#
+# Every request has connect/read timeouts and an overall deadline. Failed requests are retried only
+# while the retry budget allows, so an outage doesn't turn into a retry storm, and a host that keeps
+# failing has its circuit opened: requests to it fail straight away until it's given another try.
+
+CONNECT_TIMEOUT = 5
+READ_TIMEOUT = 10
+# the most a request can take, however slowly the bytes trickle in
+REQUEST_DEADLINE = 15
+MAX_CONNECTIONS = 8
+# the MTA feeds are polled every 30 seconds, keep the connections open between polls
+KEEPALIVE_EXPIRY = 90
+
+MAX_ATTEMPTS = 3
+RETRY_DELAY = 0.5
+# retries can add at most RETRY_RATIO of the requests made in the last RETRY_WINDOW seconds,
+# though RETRY_MIN are always allowed
+RETRY_WINDOW = 60
+RETRY_RATIO = 0.2
+RETRY_MIN = 3
+
+# a host's circuit opens after this many failures in a row, and is tried again after the cooldown
+CIRCUIT_FAILURES = 5
+CIRCUIT_COOLDOWN = 60
+
+Request = namedtuple('Request', ['url', 'headers', 'params'], defaults=(None, None))
+
+
+class FetchError(Exception):
+    pass
+
+
+class FetchTimeout(FetchError):
+    pass
+
+
+class CircuitOpenError(FetchError):
+    pass
+
+
+class RetryBudget:
+    def __init__(self, window=RETRY_WINDOW, ratio=RETRY_RATIO, minimum=RETRY_MIN):
+        self.window = window
+        self.ratio = ratio
+        self.minimum = minimum
+        self.requests = deque()
+        self.retries = deque()
+
+    def expire(self, now):
+        for times in (self.requests, self.retries):
+            while times and times[0] < now - self.window:
+                times.popleft()
+
+    def request(self):
+        self.requests.append(time.monotonic())
+
+    def retry(self):
+        # True if there's budget for one more retry, which is then spent
+        now = time.monotonic()
+        self.expire(now)
+        if len(self.retries) >= max(self.minimum, self.ratio * len(self.requests)):
+            METRICS.count('fetch_retry_budget_exhausted_total')
+            return False
+        self.retries.append(now)
+        METRICS.count('fetch_retries_total')
+        return True
+
+
+class CircuitBreaker:
+    def __init__(self, host, failures=CIRCUIT_FAILURES, cooldown=CIRCUIT_COOLDOWN):
+        self.host = host
+        self.max_failures = failures
+        self.cooldown = cooldown
+        self.failures = 0
+        # time.monotonic() the circuit opened, None while closed
+        self.opened_at = None
+        # a request let through to see if the host is back
+        self.trial = False
+
+    def allow(self):
+        if self.opened_at is None:
+            return True
+        if self.trial or time.monotonic() - self.opened_at < self.cooldown:
+            return False
+        # half open
+        self.trial = True
+        return True
+
+    def succeeded(self):
+        if self.opened_at is not None:
+            METRICS.set('fetch_circuit_open', 0, host=self.host)
+        self.failures = 0
+        self.opened_at = None
+        self.trial = False
+
+    def failed(self):
+        self.failures += 1
+        if self.trial or self.failures >= self.max_failures:
+            if self.opened_at is None:
+                METRICS.count('fetch_circuit_opened_total', host=self.host)
+            self.opened_at = time.monotonic()
+            self.trial = False
+            METRICS.set('fetch_circuit_open', 1, host=self.host)
+
+    @property
+    def open(self):
+        return self.opened_at is not None
+
+
+class FetchEngine:
+    def __init__(self):
+        self.budget = RetryBudget()
+        # host -> CircuitBreaker
+        self.breakers = {}
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name='fetch-engine', daemon=True)
+        self.thread.start()
+        self.client = self.run(self.create_client())
+
+    async def create_client(self):
+        # made on the loop that will use it
+        return httpx.AsyncClient(timeout=httpx.Timeout(READ_TIMEOUT, connect=CONNECT_TIMEOUT),
+                                 limits=httpx.Limits(max_connections=MAX_CONNECTIONS,
+                                                     max_keepalive_connections=MAX_CONNECTIONS,
+                                                     keepalive_expiry=KEEPALIVE_EXPIRY),
+                                 follow_redirects=True)
+
+    def run(self, coroutine):
+        # runs coroutine on the engine's loop and waits for it, from any other thread
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result()
+
+    def get(self, url, headers=None, params=None):
+        # an httpx.Response, or raises FetchError
+        response, = self.get_many([Request(url, headers, params)])
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+    def get_many(self, requests):
+        # fetches requests concurrently, a list of an httpx.Response or FetchError for each
+        return self.run(self.fetch_all(requests))
+
+    async def fetch_all(self, requests):
+        return await asyncio.gather(*(self.fetch(request) for request in requests), return_exceptions=True)
+
+    def breaker(self, url):
+        host = urlparse(url).netloc
+        breaker = self.breakers.get(host)
+        if breaker is None:
+            breaker = self.breakers[host] = CircuitBreaker(host)
+        return breaker
+
+    async def fetch(self, request):
+        breaker = self.breaker(request.url)
+        self.budget.request()
+        attempt = 1
+        while True:
+            if not breaker.allow():
+                raise CircuitOpenError(f'{breaker.host} is failing, not trying again yet')
+
+            try:
+                response = await asyncio.wait_for(
+                    self.client.get(request.url, headers=request.headers, params=request.params), REQUEST_DEADLINE)
+            except (asyncio.TimeoutError, httpx.TimeoutException) as e:
+                error = FetchTimeout(f'Timed out fetching {request.url}')
+                error.__cause__ = e
+            except httpx.HTTPError as e:
+                # connection errors, and the likes of too many redirects or a body that won't decode
+                error = FetchError(f'Error fetching {request.url}: {e!r}')
+                error.__cause__ = e
+            except Exception as e:
+                # not worth retrying, but the breaker still has to hear how a trial went
+                breaker.failed()
+                error = FetchError(f'Error fetching {request.url}: {e!r}')
+                error.__cause__ = e
+                raise error
+            else:
+                if response.status_code < 500:
+                    breaker.succeeded()
+                    return response
+                # the server is up but struggling, worth another try
+                error = None
+
+            breaker.failed()
+            if attempt >= MAX_ATTEMPTS or breaker.open or not self.budget.retry():
+                if error is None:
+                    return response
+                raise error
+            await asyncio.sleep(RETRY_DELAY * 2 ** (attempt - 1))
+            attempt += 1
+
+    def close(self):
+        self.run(self.client.aclose())
+        self.loop.call_soon_threadsafe(self.loop.stop)
@@ -0,0 +1,91 @@
+
+
+1.0ԵQ
+FS0J
+0
+048400_F..S20240305*F>
+0F 0804 F20/F27Ե򵜯"F27SH
+FS0v"@
+0
+048400_F..S20240305*F>
+0F 0804 F20/F27 (:F27S
+FS1
+0
+049100_F..S20240305*F>
+0F 0811 F20/F27"F23S궜"F24Sķⷜ"F25S"F26S"F27SH
+FS1v"@
+0
+049100_F..S20240305*F>
+0F 0811 F20/F27 (:F23S
+FS2
+0
+049800_F..S20240305*F>
+0F 0818 F20/F27ķ"F20S"F21Sڸ"F22Sҹ"F23S"F24S躜"F25S»ໜ"F26S"F27S
+FS3
+0
+050500_F..S20240305*F>
+0F 0825 F20/F27ʺ躜"F20S»"F21S"F22Sؼ"F23Sн"F24S"F25S澜"F26S޿"F27SQ
+FN0J
+0
+048500_F..N20240305*F>
+0F 0805 F27/F20"F20NH
+FN0v"@
+0
+048500_F..N20240305*F>
+0F 0805 F27/F20 (:F20N
+FN1
+0
+049200_F..N20240305*F>
+0F 0812 F27/F20򵜯"F25N̶궜"F24Nķ"F23N"F22Nڸ"F21Nҹ"F20NH
+FN1v"@
+0
+049200_F..N20240305*F>
+0F 0812 F27/F20 (:F25N
+FN2
+0
+049900_F..N20240305*F>
+0F 0819 F27/F20ⷜ"F27Nڸ"F26N"F25N𹜯"F24Nʺ躜"F23N»"F22N"F21Nؼ"F20N
+FN3
+0
+050600_F..N20240305*F>
+0F 0826 F27/F20"F27Nໜ"F26Nؼ"F25N"F24N"F23NȾ澜"F22N"F21N"F20Ni
+DS0b
+0
+049000_D..S20240305*D>
+0D 0810 R31/R36"R35S궜"R36SH
+DS0v"@
+0
+049000_D..S20240305*D>
+0D 0810 R31/R36 (:R35S
+DS1
+0
+049700_D..S20240305*D>
+0D 0817 R31/R36̶궜"R31Sķ"R32S"R33Sڸ"R34Sҹ"R35S"R36S
+DS2
+0
+050400_D..S20240305*D>
+0D 0824 R31/R36𹜯"R31Sʺ躜"R32S»"R33S"R34Sؼ"R35Sн"R36S
+DS3
+0
+051100_D..S20240305*D>
+0D 0831 R31/R36"R31S"R32SȾ澜"R33S"R34S"R35S"R36S
+DN0z
+0
+049100_D..N20240305*D>
+0D 0811 R36/R31򵜯"R33N̶궜"R32Nķ"R31NH
+DN0v"@
+0
+049100_D..N20240305*D>
+0D 0811 R36/R31 (:R33N
+DN1
+0
+049800_D..N20240305*D>
+0D 0818 R36/R31"R36Nⷜ"R35Nڸ"R34N"R33N𹜯"R32Nʺ躜"R31N
+DN2
+0
+050500_D..N20240305*D>
+0D 0825 R36/R31ʺ"R36N"R35Nໜ"R34Nؼ"R33N"R32N"R31N
+DN3
+0
+051200_D..N20240305*D>
+0D 0832 R36/R31н"R36NȾ"R35N"R34N޿"R33N"R32N"R31N
\ No newline at end of file
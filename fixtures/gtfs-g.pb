@@ -0,0 +1,51 @@
+
+
+1.0ԵQ
+GS0J
+0
+048400_G..S20240305*G>
+0G 0804 F20/F27Ե򵜯"F27SH
+GS0v"@
+0
+048400_G..S20240305*G>
+0G 0804 F20/F27 (:F27S
+GS1
+0
+049100_G..S20240305*G>
+0G 0811 F20/F27"F23S궜"F24Sķⷜ"F25S"F26S"F27SH
+GS1v"@
+0
+049100_G..S20240305*G>
+0G 0811 F20/F27 (:F23S
+GS2
+0
+049800_G..S20240305*G>
+0G 0818 F20/F27ķ"F20S"F21Sڸ"F22Sҹ"F23S"F24S躜"F25S»ໜ"F26S"F27S
+GS3
+0
+050500_G..S20240305*G>
+0G 0825 F20/F27ʺ躜"F20S»"F21S"F22Sؼ"F23Sн"F24S"F25S澜"F26S޿"F27SQ
+GN0J
+0
+048500_G..N20240305*G>
+0G 0805 F27/F20"F20NH
+GN0v"@
+0
+048500_G..N20240305*G>
+0G 0805 F27/F20 (:F20N
+GN1
+0
+049200_G..N20240305*G>
+0G 0812 F27/F20򵜯"F25N̶궜"F24Nķ"F23N"F22Nڸ"F21Nҹ"F20NH
+GN1v"@
+0
+049200_G..N20240305*G>
+0G 0812 F27/F20 (:F25N
+GN2
+0
+049900_G..N20240305*G>
+0G 0819 F27/F20ⷜ"F27Nڸ"F26N"F25N𹜯"F24Nʺ躜"F23N»"F22N"F21Nؼ"F20N
+GN3
+0
+050600_G..N20240305*G>
+0G 0826 F27/F20"F27Nໜ"F26Nؼ"F25N"F24N"F23NȾ澜"F22N"F21N"F20N
\ No newline at end of file
@@ -0,0 +1,111 @@
+
+
+1.0ԵQ
+RS0J
+0
+047400_R..S20240305*R>
+0R 0754 R20/R34Ե򵜯"R34SH
+RS0v"@
+0
+047400_R..S20240305*R>
+0R 0754 R20/R34 (:R34S
+RS1
+0
+048100_R..S20240305*R>
+0R 0801 R20/R34"R30S궜"R31Sķⷜ"R32S"R33S"R34SH
+RS1v"@
+0
+048100_R..S20240305*R>
+0R 0801 R20/R34 (:R30S
+RS2
+0
+048800_R..S20240305*R>
+0R 0808 R20/R34򵜯"R25S̶궜"R26Sķ"R27S"R28Sڸ"R29Sҹ"R30S"R31S躜"R32S»ໜ"R33S"R34SH
+RS2v"@
+0
+048800_R..S20240305*R>
+0R 0808 R20/R34 (:R25S
+RS3
+0
+049500_R..S20240305*R>
+0R 0815 R20/R34Ե򵜯"R20S̶"R21S"R22Sⷜ"R23Sڸ"R24S"R25S𹜯"R26Sʺ躜"R27S»"R28S"R29Sؼ"R30Sн"R31S"R32S澜"R33S޿"R34SH
+RS3v"@
+0
+049500_R..S20240305*R>
+0R 0815 R20/R34 (:R20SQ
+RN0J
+0
+047500_R..N20240305*R>
+0R 0755 R34/R20"R20NH
+RN0v"@
+0
+047500_R..N20240305*R>
+0R 0755 R34/R20 (:R20N
+RN1
+0
+048200_R..N20240305*R>
+0R 0802 R34/R20򵜯"R25N̶궜"R24Nķ"R23N"R22Nڸ"R21Nҹ"R20NH
+RN1v"@
+0
+048200_R..N20240305*R>
+0R 0802 R34/R20 (:R25N
+RN2
+0
+048900_R..N20240305*R>
+0R 0809 R34/R20Ե򵜯"R30N̶"R29N"R28Nⷜ"R27Nڸ"R26N"R25N𹜯"R24Nʺ躜"R23N»"R22N"R21Nؼ"R20NH
+RN2v"@
+0
+048900_R..N20240305*R>
+0R 0809 R34/R20 (:R30N
+RN3
+0
+049600_R..N20240305*R>
+0R 0816 R34/R20"R34N궜"R33Nķⷜ"R32N"R31N"R30Nҹ𹜯"R29Nʺ"R28N"R27Nໜ"R26Nؼ"R25N"R24N"R23NȾ澜"R22N"R21N"R20Ni
+NS0b
+0
+048400_N..S20240305*N>
+0N 0804 R20/R34"R33S궜"R34SH
+NS0v"@
+0
+048400_N..S20240305*N>
+0N 0804 R20/R34 (:R33S
+NS1
+0
+049100_N..S20240305*N>
+0N 0811 R20/R34򵜯"R23S̶궜"Q01Sķ"R30S"R31Sڸ"R32Sҹ"R33S"R34SH
+NS1v"@
+0
+049100_N..S20240305*N>
+0N 0811 R20/R34 (:R23S
+NS2
+0
+049800_N..S20240305*N>
+0N 0818 R20/R34"R20Sⷜ"R21Sڸ"R22S"R23S𹜯"Q01Sʺ躜"R30S»"R31S"R32Sؼ"R33Sн"R34S
+NS3
+0
+050500_N..S20240305*N>
+0N 0825 R20/R34ʺ"R20S"R21Sໜ"R22Sؼ"R23S"Q01S"R30SȾ澜"R31S"R32S"R33S"R34S
+NN0z
+0
+048500_N..N20240305*N>
+0N 0805 R34/R20򵜯"R22N̶궜"R21Nķ"R20NH
+NN0v"@
+0
+048500_N..N20240305*N>
+0N 0805 R34/R20 (:R22N
+NN1
+0
+049200_N..N20240305*N>
+0N 0812 R34/R20Ե򵜯"R32N̶"R31N"R30Nⷜ"Q01Nڸ"R23N"R22N𹜯"R21Nʺ躜"R20NH
+NN1v"@
+0
+049200_N..N20240305*N>
+0N 0812 R34/R20 (:R32N
+NN2
+0
+049900_N..N20240305*N>
+0N 0819 R34/R20ķⷜ"R34N"R33N"R32Nҹ𹜯"R31Nʺ"R30N"Q01Nໜ"R23Nؼ"R22N"R21N"R20N
+NN3
+0
+050600_N..N20240305*N>
+0N 0826 R34/R20躜"R34N»ໜ"R33N"R32N"R31Nн"R30NȾ"Q01N"R23N޿"R22N"R21N"R20N
\ No newline at end of file
@@ -0,0 +1,147 @@
+import numpy as np
+
+from sprites import BdfFont, FrameBuffer, SpriteBuilder
+
+# An in-memory stand-in for rgbmatrix: RGBMatrix, RGBMatrixOptions and, as this module itself,
+# graphics. Frames are kept as numpy pixels instead of going to a panel, so rendering can be timed
+# and checked against golden frames on a machine without one:
+#
+#   python benchmark.py --record                                   # record feeds to ./fixtures
+#   python main.py --headless --led-cols 64 --update-golden        # save their frames as golden
+#   python main.py --headless --led-cols 64                        # check and time the frames
+
+
+class RGBMatrixOptions:
+    # only the panel geometry matters here, the rest of SampleBase's options are just kept
+    def __init__(self):
+        self.rows = 32
+        self.cols = 32
+        self.chain_length = 1
+        self.parallel = 1
+
+
+class Canvas:
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        self.framebuffer = FrameBuffer(width, height)
+        self.pixels = self.framebuffer.pixels
+
+    def SetPixel(self, x, y, red, green, blue):
+        if 0 <= x < self.width and 0 <= y < self.height:
+            self.pixels[y, x] = (red, green, blue)
+
+    def SetImage(self, image, offset_x=0, offset_y=0, unsafe=True):
+        pixels = np.asarray(image.convert('RGB'))
+        region = self.framebuffer.clip(offset_x, offset_y, pixels.shape[1], pixels.shape[0])
+        if region is not None:
+            (rows, cols), (image_rows, image_cols) = region
+            self.pixels[rows, cols] = pixels[image_rows, image_cols]
+
+    def Fill(self, red, green, blue):
+        self.pixels[:] = (red, green, blue)
+
+    def Clear(self):
+        self.pixels[:] = 0
+
+
+class RGBMatrix:
+    # double buffered like the real matrix, SwapOnVSync puts a canvas on screen and hands back the
+    # one that was there
+    def __init__(self, options=None):
+        if options is None:
+            options = RGBMatrixOptions()
+        self.width = options.cols * options.chain_length
+        self.height = options.rows * options.parallel
+        self.brightness = 100
+        # the canvas on screen
+        self.front = Canvas(self.width, self.height)
+        self.swaps = 0
+
+    def CreateFrameCanvas(self):
+        return Canvas(self.width, self.height)
+
+    def SwapOnVSync(self, canvas, framerate_fraction=1):
+        self.swaps += 1
+        shown, self.front = self.front, canvas
+        return shown
+
+    @property
+    def framebuffer(self):
+        # drawing on the matrix draws on the canvas on screen
+        return self.front.framebuffer
+
+    def screen(self):
+        # a copy of the pixels on screen
+        return self.front.pixels.copy()
+
+    def SetPixel(self, x, y, red, green, blue):
+        self.front.SetPixel(x, y, red, green, blue)
+
+    def SetImage(self, image, offset_x=0, offset_y=0, unsafe=True):
+        self.front.SetImage(image, offset_x, offset_y, unsafe)
+
+    def Fill(self, red, green, blue):
+        self.front.Fill(red, green, blue)
+
+    def Clear(self):
+        self.front.Clear()
+
+
+class Color:
+    def __init__(self, red=0, green=0, blue=0):
+        self.red = red
+        self.green = green
+        self.blue = blue
+
+
+class Font:
+    def __init__(self):
+        self.bdf = None
+
+    def LoadFont(self, path):
+        self.bdf = BdfFont(path)
+
+    def CharacterWidth(self, codepoint):
+        return self.bdf.character_width(codepoint)
+
+
+def DrawText(canvas, font, x, y, color, text):
+    # returns the width drawn, like rgbmatrix
+    canvas.framebuffer.blit(SpriteBuilder().text(font.bdf, x, y, (color.red, color.green, color.blue), text).build())
+    return font.bdf.text_width(text)
+
+
+def DrawLine(canvas, x0, y0, x1, y1, color):
+    # Bresenham
+    dx = abs(x1 - x0)
+    dy = -abs(y1 - y0)
+    step_x = 1 if x0 < x1 else -1
+    step_y = 1 if y0 < y1 else -1
+    error = dx + dy
+    while True:
+        canvas.SetPixel(x0, y0, color.red, color.green, color.blue)
+        if (x0, y0) == (x1, y1):
+            return
+        if 2 * error >= dy:
+            error += dy
+            x0 += step_x
+        if 2 * error <= dx:
+            error += dx
+            y0 += step_y
+
+
+def DrawCircle(canvas, x, y, radius, color):
+    # midpoint circle, the outline only
+    dx = radius
+    dy = 0
+    error = 0
+    while dx >= dy:
+        for px, py in ((dx, dy), (dy, dx), (-dy, dx), (-dx, dy), (-dx, -dy), (-dy, -dx), (dy, -dx), (dx, -dy)):
+            canvas.SetPixel(x + px, y + py, color.red, color.green, color.blue)
+        dy += 1
+        if error <= 0:
+            error += 2 * dy + 1
+        if error > 0:
+            dx -= 1
+            error -= 2 * dx + 1
@@ -0,0 +1,36 @@
+from collections import namedtuple
+import math
+
+# Tiles the configured stops across however many panels are chained (--led-chain, --led-cols) and
+# stacked (--led-parallel, --led-rows), so every stop that fits is on screen at once. Each tile is
+# a stop's header or its next trains, drawn for a 64 pixel wide panel at the tile's x, y. Stops
+# that don't fit go on further pages, shown one after the other.
+
+TILE_WIDTH = 64
+# a header and a message, or two train rows
+TILE_HEIGHT = 32
+# each train row is 15 pixels tall, a 32 pixel tile fits two
+ROW_HEIGHT = 15
+
+Tile = namedtuple('Tile', ['stop_id', 'x', 'y', 'num_rows'])
+
+
+class Layout:
+    def __init__(self, width, height, stop_ids, tile_width=TILE_WIDTH, tile_height=TILE_HEIGHT):
+        stop_ids = tuple(stop_ids)
+        # a grid as close to filling the panels as the stops allow, left to right then top to bottom
+        max_columns = max(1, width // tile_width)
+        max_tile_rows = max(1, height // tile_height)
+        per_page = min(len(stop_ids), max_columns * max_tile_rows)
+        columns = min(max_columns, per_page)
+        tile_rows = math.ceil(per_page / columns)
+        # tiles share out the spare height, for more train rows each
+        height_each = height // tile_rows
+        # the trains shown for each stop, at least one even on a short panel
+        self.num_rows = max(1, height_each // ROW_HEIGHT)
+
+        self.pages = []
+        for start in range(0, len(stop_ids), per_page):
+            self.pages.append(tuple(
+                Tile(stop_id, tile_ind % columns * tile_width, tile_ind // columns * height_each, self.num_rows)
+                for tile_ind, stop_id in enumerate(stop_ids[start:start + per_page])))
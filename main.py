@@ -1,92 +1,648 @@
+import time
+
+# as early as possible, so --profile-startup covers our own imports
+STARTUP_TIME = time.perf_counter()
+
+from collections import namedtuple
 from datetime import datetime, time as dt_time, timedelta
+import hashlib
+import heapq
 import importlib
+import io
+import multiprocessing
+from operator import attrgetter
 import os
-import time
 import signal
+import sys
+import threading
+from urllib.parse import unquote, urlparse
 import warnings
 
-from nyct_gtfs import NYCTFeed
-from pyowm import OWM
-
-# from PIL import Image
-
-if os.name == 'nt':
-    graphics = importlib.import_module('RGBMatrixEmulator', 'graphics')
-else:
-    from rgbmatrix import graphics
+import numpy as np
+from PIL import Image
 
+from config import CONFIG_FILE, STOP_ROUTES_FILE, load_config, load_stations, station_id
+from layout import ROW_HEIGHT, Layout
+from metrics import METRICS, start_metrics_server
+from replay import ReplayEngine, capture_path
 from samplebase import SampleBase
+from shared_arrivals import ArrivalsFile, SharedArrivals, Train
+from sprites import BdfFont, Frame, FrameRenderer, SpriteBuilder, SpriteCache
+from weather_service import WeatherService, load_icons
+
+# nyct_gtfs, httpx (through fetch) and pyowm are slow to import on a Pi, they're loaded with lazy_import
+# when first used
 
 FEEDS = None
+# the fetch.FetchEngine all our HTTP goes through, the feed and weather refreshers both create it
+FETCH_ENGINE = None
+FETCH_ENGINE_LOCK = threading.Lock()
+# trips.txt/stops.txt tables shared by all the feeds, they only need reading once
+STATIC_GTFS = None
+# latest FeedSnapshot, only ever replaced wholesale by the refresher so the render loop can read it without a lock
+SNAPSHOT = None
+# the ArrivalIndex the snapshots' arrivals come from, only touched by the refresher
+ARRIVAL_INDEX = None
 NOW = None
-# owm = OWM(os.environ['OWM_API_KEY'])
-# mgr = owm.weather_manager()
-WEATHER = None
-FORECAST = None
-WEATHER_TIMESTAMP = None
+# what the display and refresher take as the time now, frozen by --headless so its frames are reproducible
+CLOCK = datetime.now
+# and what the countdowns count down against
+MONOTONIC = time.monotonic
+# seconds of CLOCK and MONOTONIC per real second, --replay-speed
+SPEED = 1
+# --capture saves every new version of each feed here, for --replay
+CAPTURE_DIR = None
+
+
+NO_ARRIVAL = datetime(9999, 1, 1, 0, 0, 0)
+# seconds from starting main.py to the first frame on the panel we aim for
+FIRST_FRAME_TARGET = 1.0
+FEED_TIMEOUT = 10
+# the last good copy of each feed, loaded at startup so the first frame doesn't wait on the network
+FEED_CACHE_DIR = './cache'
+# and the arrivals last published from them, in FEED_CACHE_DIR, shown before the feeds are even parsed
+ARRIVALS_FILE = 'arrivals.bin'
+# feeds to check for a station that isn't in STOP_ROUTES_FILE
+DEFAULT_FEED_ROUTES = ('F', 'G', 'R')
+# route letters in a station header are 6 pixels apart, ending at the right of the panel
+HEADER_ROUTE_SPACING = 6
+# seconds between polls of the MTA feeds, and while a train is due within ARRIVING_WINDOW
+POLL_INTERVAL = 30
+POLL_INTERVAL_ARRIVING = 10
+ARRIVING_WINDOW = timedelta(minutes=2)
+# the MTA publishes each feed about this often, we poll just after the next one is due
+FEED_PUBLISH_PERIOD = 30
+FEED_PUBLISH_SLACK = 2
+# how often to check the schedule while no trains are shown, and how far ahead to start fetching
+IDLE_CHECK_INTERVAL = 60
+PREFETCH_LEAD = timedelta(minutes=1)
+# a failing feed is retried after FEED_RETRY_MIN seconds, doubling each time up to FEED_RETRY_MAX
+FEED_RETRY_MIN = 30
+FEED_RETRY_MAX = 600
+# a fetcher process that died is started again, but no more often than this many seconds
+FETCHER_RESTART_INTERVAL = 30
+
+# feeds recorded with benchmark.py --record (made up ones from --synthetic are checked in), and the
+# frames --headless renders from them
+FIXTURES_DIR = './fixtures'
+GOLDEN_DIR = './fixtures/golden'
+# the fixtures are New York feeds, rendered in New York time wherever the golden frames are checked
+FIXTURES_TZ = 'America/New_York'
+
+FeedSnapshot = namedtuple('FeedSnapshot', ['timestamp', 'arrivals'])
+Arrival = namedtuple('Arrival', ['time', 'trip'])
+
+
+class Countdown:
+    # an arrival with its time as a MONOTONIC deadline, so the minutes count down every frame without
+    # going back to the snapshot, and NTP setting a Pi's clock after boot doesn't make them jump
+    def __init__(self, arrival, now, monotonic_now):
+        self.arrival = arrival
+        self.deadline = monotonic_now + (arrival.time - now).total_seconds()
+
+    def minutes(self, monotonic_now):
+        return int((self.deadline - monotonic_now) / 60)
+
+
+class StartupProfile:
+    # how long each part of startup took, printed with --profile-startup
+    def __init__(self, start):
+        self.start = start
+        self.last = start
+        self.steps = []
+        self.imports = []
+
+    def mark(self, step):
+        # the time since the previous mark
+        now = time.perf_counter()
+        self.steps.append((step, now - self.last))
+        self.last = now
+
+    def add_import(self, name, seconds):
+        self.imports.append((name, seconds))
+
+    def report(self):
+        print('Startup profile:')
+        for step, seconds in self.steps:
+            print(f'  {step: <28s} {seconds * 1000:8.1f}ms')
+        for name, seconds in self.imports:
+            print(f'  {"(import " + name + ")": <28s} {seconds * 1000:8.1f}ms')
+        first_frame = self.last - self.start
+        status = 'ok' if first_frame <= FIRST_FRAME_TARGET else 'SLOW'
+        print(f'  {"time to first frame": <28s} {first_frame * 1000:8.1f}ms '
+              f'(target {FIRST_FRAME_TARGET * 1000:.0f}ms, {status})')
+
+
+PROFILE = StartupProfile(STARTUP_TIME)
 
 
 class GracefulKiller:
-    def __init__(self):
+    def __init__(self, scheduler=None):
         self.kill_now = False
+        self.scheduler = scheduler
         signal.signal(signal.SIGINT, self.exit_gracefully)
         signal.signal(signal.SIGTERM, self.exit_gracefully)
 
     def exit_gracefully(self, signum, frame):
         self.kill_now = True
+        if self.scheduler is not None:
+            self.scheduler.kill()
+
+
+class Scheduler:
+    # paces the display against MONOTONIC deadlines, so frames don't drift, and wakes up
+    # early when new train data arrives or we're asked to stop
+    def __init__(self, fps=2):
+        self.frame_interval = 1 / fps
+        self.wake_event = threading.Event()
+        self.kill_now = False
+
+    def wake(self):
+        self.wake_event.set()
+
+    def kill(self):
+        self.kill_now = True
+        self.wake_event.set()
+
+    def wait_until(self, deadline):
+        # returns True if woken before the deadline
+        timeout = deadline - MONOTONIC()
+        if timeout <= 0 or self.kill_now:
+            return False
+        woken = self.wake_event.wait(timeout / SPEED)
+        self.wake_event.clear()
+        return woken
+
+    def frames(self, dwell):
+        # yields once per frame until dwell seconds are up
+        start = MONOTONIC()
+        end = start + dwell
+        next_frame = start
+        while not self.kill_now:
+            yield
+            next_frame += self.frame_interval
+            now = MONOTONIC()
+            if next_frame < now:
+                # we fell behind, skip the missed frames rather than rushing them
+                next_frame = now
+            if next_frame >= end:
+                self.wait_until(end)
+                return
+            self.wait_until(next_frame)
+
+    def sleep(self, dwell):
+        # like time.sleep but a kill signal cuts it short
+        end = MONOTONIC() + dwell
+        while not self.kill_now and MONOTONIC() < end:
+            self.wait_until(end)
+
+
+class SingleFrameScheduler(Scheduler):
+    # for --headless, every display_ method draws exactly one frame and never sleeps
+    def frames(self, dwell):
+        yield
+
+    def sleep(self, dwell):
+        pass
+
+
+class NextArrivals:
+    # keeps only the k earliest arrivals pushed into it, as a bounded max-heap
+    def __init__(self, k):
+        self.k = k
+        self.heap = []
+        self.count = 0
+
+    def push(self, arrival):
+        if self.k <= 0:
+            return
+        # the counter breaks ties so Trip objects are never compared
+        entry = (-arrival.time.timestamp(), self.count, arrival)
+        self.count += 1
+        if len(self.heap) < self.k:
+            heapq.heappush(self.heap, entry)
+        elif entry[0] > self.heap[0][0]:
+            heapq.heapreplace(self.heap, entry)
+
+    def extend(self, arrivals):
+        for arrival in arrivals:
+            self.push(arrival)
+        return self
+
+    def arrivals(self):
+        return tuple(entry[2] for entry in sorted(self.heap, key=lambda entry: (-entry[0], entry[1])))
+
+
+def trip_fingerprint(train):
+    # a digest of the trip's messages, so they can be compared with the next refresh's without
+    # holding on to them. a sub-message keeps the whole parsed feed it came from alive
+    digest = hashlib.sha1(train._trip_update.SerializeToString(deterministic=True))
+    if train._vehicle_update is not None:
+        digest.update(train._vehicle_update.SerializeToString(deterministic=True))
+    return digest.digest()
+
+
+class ArrivalIndex:
+    # stop_id -> arrivals sorted by time, kept up to date trip by trip. A trip whose TripUpdate and
+    # VehiclePosition are the same as last refresh isn't looked at again, and only the stops of
+    # trips that did change are re-sorted. Arrivals hold a Train, not the Trip, so nothing from a
+    # feed is kept once it's been indexed
+    def __init__(self, depth=None):
+        # with a depth only that many arrivals are kept per stop
+        self.depth = depth
+        # (feed, trip) -> (fingerprint, underway, {stop_id: Arrival})
+        self.trips = {}
+        # stop_id -> {(feed, trip): Arrival}
+        self.stop_entries = {}
+        # stop_id -> arrivals sorted by time
+        self.arrivals = {}
+
+    def update(self, feed_key, trips, stop_ids=None):
+        # the latest trips of one feed, stop_ids the stops it's indexed for (None for all of them).
+        # returns the stop_ids whose arrivals changed
+        trip_identifier = lazy_import('nyct_gtfs').NYCTFeed._trip_identifier
+        changed = set()
+        seen = set()
+        for train in trips:
+            key = (feed_key, trip_identifier(train._trip_update.trip))
+            seen.add(key)
+            # a train still waiting to leave becomes underway as the feed's clock moves on
+            underway = train.underway
+            fingerprint = trip_fingerprint(train)
+            previous = self.trips.get(key)
+            if previous is not None and previous[0] == fingerprint and previous[1] == underway:
+                continue
+
+            times = dict(trip_arrival_times(train, stop_ids))
+            # headsign_text is slow to work out, only trips stopping where we look need a Train
+            info = Train.from_trip(train) if times else None
+            entries = {stop_id: Arrival(t, info) for stop_id, t in times.items()}
+            previous_entries = previous[2] if previous is not None else {}
+            self.remove(key, [stop_id for stop_id in previous_entries if stop_id not in entries], changed)
+            for stop_id, arrival in entries.items():
+                previous_arrival = previous_entries.get(stop_id)
+                if (previous_arrival is not None and previous_arrival.time == arrival.time and
+                        previous_arrival.trip == info):
+                    # nothing on screen would change
+                    entries[stop_id] = previous_arrival
+                    continue
+                self.stop_entries.setdefault(stop_id, {})[key] = arrival
+                changed.add(stop_id)
+            self.trips[key] = (fingerprint, underway, entries)
+
+        # trips that have finished or been cancelled
+        for key in [key for key in self.trips if key[0] == feed_key and key not in seen]:
+            self.remove(key, self.trips.pop(key)[2], changed)
+
+        for stop_id in changed:
+            entries = self.stop_entries.get(stop_id)
+            if not entries:
+                self.stop_entries.pop(stop_id, None)
+                self.arrivals.pop(stop_id, None)
+            elif self.depth is None:
+                self.arrivals[stop_id] = tuple(sorted(entries.values(), key=attrgetter('time')))
+            else:
+                self.arrivals[stop_id] = NextArrivals(self.depth).extend(entries.values()).arrivals()
+        return changed
+
+    def remove(self, key, entries, changed):
+        for stop_id in entries:
+            del self.stop_entries[stop_id][key]
+            changed.add(stop_id)
+
+
+class ConditionalFeed:
+    # wraps an NYCTFeed so unchanged feeds are neither downloaded again nor reparsed
+    def __init__(self, feed_specifier, stop_ids=None):
+        self.feed = new_nyct_feed(feed_specifier)
+        # the stops this feed is queried for, None for all of them
+        self.stop_ids = stop_ids
+        self.etag = None
+        self.last_modified = None
+        self.digest = None
+        self.header_timestamp = None
+        # trips loaded but not yet indexed, the index keeps what's needed of them
+        self.trips = None
+        # consecutive failed refreshes, and the MONOTONIC() before which we don't try again
+        self.failures = 0
+        self.retry_at = 0
+
+    def request(self):
+        # a fetch.Request for the feed, conditional on what we already have
+        headers = {}
+        if self.etag is not None:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified is not None:
+            headers['If-Modified-Since'] = self.last_modified
+        return lazy_import('fetch').Request(self.feed._feed_url, headers=headers)
+
+    def handle(self, response):
+        # returns True if the response has new trips
+        METRICS.observe('feed_fetch_seconds', response.elapsed.total_seconds(), feed=self.feed_id)
+        METRICS.count('feed_fetched_bytes_total', len(response.content), feed=self.feed_id)
+        if response.status_code == 304:
+            METRICS.count('feed_not_modified_total', feed=self.feed_id)
+            return False
+        if response.status_code != 200:
+            raise RuntimeError(f'Error accessing MTA data feed: {response.content}')
+
+        loaded = self.load(response.content)
+        # only once it's parsed, or a truncated body would get 304s until the MTA publishes again
+        self.etag = response.headers.get('ETag')
+        self.last_modified = response.headers.get('Last-Modified')
+        if not loaded:
+            return False
+        self.save(response.content)
+        if CAPTURE_DIR is not None:
+            self.capture(response.content)
+        return True
+
+    def succeeded(self):
+        self.failures = 0
+        self.retry_at = 0
+
+    def failed(self):
+        # backs off exponentially
+        self.failures += 1
+        self.retry_at = MONOTONIC() + min(FEED_RETRY_MAX, FEED_RETRY_MIN * 2 ** (self.failures - 1))
+
+    @property
+    def feed_id(self):
+        # e.g. gtfs-bdfm
+        return unquote(urlparse(self.feed._feed_url).path).split('/')[-1]
+
+    @property
+    def cache_file(self):
+        return os.path.join(FEED_CACHE_DIR, f'{self.feed_id}.pb')
+
+    def capture(self, content):
+        timestamp = self.header_timestamp
+        if timestamp is None:
+            timestamp = int(CLOCK().timestamp())
+        path = capture_path(CAPTURE_DIR, self.feed_id, timestamp)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'wb') as fp:
+                fp.write(content)
+        except OSError as e:
+            warnings.warn(f'Could not capture feed: {e}')
+
+    def save(self, content):
+        # write then rename, so a power cut never leaves half a feed behind
+        if FEED_CACHE_DIR is None:
+            # replaying
+            return
+        try:
+            os.makedirs(FEED_CACHE_DIR, exist_ok=True)
+            tmp_file = self.cache_file + '.tmp'
+            with open(tmp_file, 'wb') as fp:
+                fp.write(content)
+            os.replace(tmp_file, self.cache_file)
+        except OSError as e:
+            warnings.warn(f'Could not cache feed: {e}')
+
+    def restore(self):
+        # returns True if a cached copy was loaded
+        try:
+            with open(self.cache_file, 'rb') as fp:
+                content = fp.read()
+        except FileNotFoundError:
+            return False
+        except OSError as e:
+            warnings.warn(f'Could not read cached feed: {e}')
+            return False
+
+        try:
+            return self.load(content)
+        except Exception as e:
+            # a corrupt cache file shouldn't stop us starting
+            warnings.warn(f'Could not load cached feed: {e}')
+            return False
+
+    def load(self, content):
+        digest = hashlib.sha1(content).digest()
+        if digest == self.digest:
+            return False
+        header_timestamp = feed_header_timestamp(content)
+        if header_timestamp is not None and header_timestamp == self.header_timestamp:
+            self.digest = digest
+            return False
+
+        with METRICS.timer('feed_parse_seconds', feed=self.feed_id):
+            self.feed.load_gtfs_bytes(content)
+            # Trip objects are rebuilt on every access of feed.trips, so take them once per load
+            self.trips = tuple(self.feed.trips)
+        # only once it's parsed, so a feed that failed to is tried again
+        self.digest = digest
+        self.header_timestamp = header_timestamp
+        # the Trips hold on to the messages they need, the rest of the parsed feed can go
+        self.feed._feed = None
+        return True
+
+    def take_trips(self):
+        # the trips from the last load, once. None if the feed hasn't loaded anything new since
+        trips, self.trips = self.trips, None
+        return trips
+
+
+class PollCadence:
+    # how long the refresher waits before polling the feeds again
+    def __init__(self, config=None, interval=POLL_INTERVAL):
+        # the screen schedule, without one we always fetch
+        self.config = config
+        self.interval = interval
+
+    def fetching(self, now):
+        # only while trains are on the schedule, or about to be
+        if self.config is None:
+            return True
+        return any('trains' in self.config.screens_at(t.time()) for t in (now, now + PREFETCH_LEAD))
+
+    def next_poll(self, feeds, stop_ids, now):
+        # seconds until the next poll
+        if not self.fetching(now):
+            return IDLE_CHECK_INTERVAL
+
+        interval = self.interval
+        snapshot = SNAPSHOT
+        if snapshot is not None and any(
+                now - ARRIVING_WINDOW / 2 <= arrival.time <= now + ARRIVING_WINDOW
+                for stop_id in stop_ids for arrival in snapshot.arrivals.get(stop_id, ())):
+            # a train is nearly here, keep its countdown fresh
+            interval = min(interval, POLL_INTERVAL_ARRIVING)
+
+        # poll just after the next feed is published, rather than up to a whole interval behind it
+        next_publish = [feed.header_timestamp + FEED_PUBLISH_PERIOD + FEED_PUBLISH_SLACK - now.timestamp()
+                        for feed in feeds if feed.header_timestamp is not None]
+        # a feed that's behind doesn't say when it will next be published
+        next_publish = [seconds for seconds in next_publish if seconds >= POLL_INTERVAL_ARRIVING]
+        if next_publish:
+            interval = min(interval, min(next_publish))
+        return interval
+
+
+class FeedRefresher(threading.Thread):
+    # pulls the MTA feeds in the background so drawing never waits on the network
+    def __init__(self, stop_ids, interval=POLL_INTERVAL, depth=2, on_update=None, stop_event=None, config=None,
+                 restore=False):
+        super(FeedRefresher, self).__init__(name='feed-refresher', daemon=True)
+        self.stop_ids = stop_ids
+        # load the cached feeds before the first fetch
+        self.restore = restore
+        self.cadence = PollCadence(config, interval)
+        self.depth = depth
+        # called with the stop_ids whose arrivals changed when a new snapshot is published
+        self.on_update = on_update
+        # a multiprocessing.Event when run in the fetcher process
+        self.stop_event = stop_event if stop_event is not None else threading.Event()
+
+    def run(self):
+        if self.restore and restore_feeds(self.stop_ids, depth=self.depth) and self.on_update is not None:
+            self.on_update(set(self.stop_ids))
+        while not self.stop_event.is_set():
+            interval = self.cadence.interval
+            try:
+                if self.cadence.fetching(CLOCK()):
+                    changed = update_feeds(self.stop_ids, self.depth)
+                    if changed and self.on_update is not None:
+                        self.on_update(changed)
+                interval = self.cadence.next_poll(get_mta_feeds(self.stop_ids), self.stop_ids, CLOCK())
+            except Exception as e:
+                # whatever went wrong, the panel is better off with the next poll than with no refresher
+                METRICS.count('feed_refresher_errors_total', error=type(e).__name__)
+                warnings.warn(f'Feed refresh failed: {e!r}')
+            METRICS.set('feed_poll_interval_seconds', interval)
+            self.stop_event.wait(interval / SPEED)
+
+    def stop(self):
+        self.stop_event.set()
+
+
+class FetcherProcess:
+    # runs a FeedRefresher in its own process, so fetching and parsing the feeds doesn't compete
+    # with drawing for the GIL, and hands the arrivals over in a SharedArrivals table
+    def __init__(self, stop_ids, depth=2, on_update=None, metrics=None, config=None, capture_dir=None):
+        self.table = SharedArrivals(stop_ids, depth, NO_ARRIVAL)
+        # called with the stop_ids whose arrivals changed when a new snapshot is published
+        self.on_update = on_update
+        self.updated = multiprocessing.Event()
+        self.stop_event = multiprocessing.Event()
+        self.args = (self.table, self.updated, self.stop_event, metrics, config, capture_dir)
+        self.process = self.new_process()
+        # MONOTONIC() the process was last started
+        self.started_at = None
+        self.reader = threading.Thread(target=self.read, name='arrivals-reader', daemon=True)
+
+    def new_process(self):
+        return multiprocessing.Process(target=run_fetcher, name='feed-fetcher', daemon=True, args=self.args)
+
+    def start(self):
+        self.started_at = MONOTONIC()
+        self.process.start()
+        self.reader.start()
+
+    def supervise(self):
+        # the shared table outlives the process, so a new one carries on where the dead one stopped
+        if self.process.is_alive() or self.stop_event.is_set():
+            return
+        if MONOTONIC() - self.started_at < FETCHER_RESTART_INTERVAL:
+            return
+        METRICS.count('fetcher_restarts_total')
+        warnings.warn(f'Fetcher process exited with code {self.process.exitcode}, starting it again')
+        self.process = self.new_process()
+        self.started_at = MONOTONIC()
+        self.process.start()
+
+    def read(self):
+        while not self.stop_event.is_set():
+            if not self.updated.wait(1):
+                self.supervise()
+                continue
+            # cleared before reading, so a write that lands meanwhile is picked up next time round
+            self.updated.clear()
+            shared = self.table.read()
+            if shared is None:
+                continue
+            changed = publish_shared_snapshot(*shared)
+            if changed and self.on_update is not None:
+                self.on_update(changed)
+
+    def stop(self):
+        self.stop_event.set()
+        # wakes the reader
+        self.updated.set()
+        self.process.join(FEED_TIMEOUT)
+        if self.process.is_alive():
+            self.process.terminate()
+        self.reader.join()
+        self.table.close()
+        self.table.unlink()
 
 
 class DisplayTrains(SampleBase):
-    def __init__(self, stop_ids, *args, **kwargs):
+    def __init__(self, stop_ids=None, *args, **kwargs):
         super(DisplayTrains, self).__init__(*args, **kwargs)
-
+        self.parser.add_argument("--fps", action="store", help="Display frames per second. Default: 2", default=2, type=float)
+        self.parser.add_argument("--profile-startup", action="store_true", help="Print how long each part of startup took once the first frame is shown")
+        self.parser.add_argument("--fetch-process", action="store_true", help="Fetch and parse the feeds in a separate process, for multi-core Pis")
+        self.parser.add_argument("--metrics-port", action="store", help="Serve Prometheus metrics on this port, and the fetch process's on the next one. Default: off", type=int)
+        self.parser.add_argument("--metrics-address", action="store", help="Address the metrics are served on. Default: 127.0.0.1", default="127.0.0.1", type=str)
+        self.parser.add_argument("--config", action="store", help="Stops, colours and screen schedule. Default: ./config.json", default=CONFIG_FILE, type=str)
+        self.parser.add_argument("--fixtures", action="store", help="Folder of recorded feeds --headless renders. Default: ./fixtures", default=FIXTURES_DIR, type=str)
+        self.parser.add_argument("--golden", action="store", help="Folder of golden frames --headless checks against. Default: ./fixtures/golden", default=GOLDEN_DIR, type=str)
+        self.parser.add_argument("--update-golden", action="store_true", help="Save the frames --headless renders as the new golden frames")
+        self.parser.add_argument("--frames", action="store", help="Frames --headless renders for timing. Default: 5000", default=5000, type=int)
+        self.parser.add_argument("--capture", action="store", help="Save every new version of each feed to this folder, for --replay. Default: off", type=str)
+        self.parser.add_argument("--replay", action="store", help="Play back the feeds saved by --capture to this folder instead of fetching them, with --headless on the in-memory canvas", type=str)
+        self.parser.add_argument("--replay-speed", action="store", help="How many times faster than real time --replay runs, 1..100. Default: 1", default=1, type=float)
+
+        # the stops to show instead of the configured ones
         self.stop_ids = stop_ids
-        self.font = graphics.Font()
-        # self.font.LoadFont("./fonts/7x13.bdf")
-        self.font.LoadFont("./fonts/helvR12.bdf")
-        self.circle_font = graphics.Font()
-        self.circle_font.LoadFont('./fonts/6x10.bdf')
-
-        # self.text_colour = graphics.Color(0, 110, 0)
-        # self.text_colour_arriving = graphics.Color(255, 66, 25)
-        self.text_colour = graphics.Color(74, 214, 9)
-        self.text_colour_arriving = graphics.Color(247, 75, 25)
-
-        self.circle_colour_bdfm = graphics.Color(255, 99, 25)
-        self.circle_colour_g = graphics.Color(108, 190, 69)
-        self.circle_colour_nqrw = graphics.Color(252, 204, 10)
-
-    def draw_filled_circle(self, canvas, x, y, color):
-        # Draw circle with lines
-        graphics.DrawLine(canvas, x - 1, y - 6, x + 1, y - 6, color)
-        graphics.DrawLine(canvas, x - 3, y - 5, x + 3, y - 5, color)
-        graphics.DrawLine(canvas, x - 4, y - 4, x + 4, y - 4, color)
-        graphics.DrawLine(canvas, x - 5, y - 3, x + 5, y - 3, color)
-        graphics.DrawLine(canvas, x - 5, y - 2, x + 5, y - 2, color)
-        graphics.DrawLine(canvas, x - 6, y - 1, x + 6, y - 1, color)
-        graphics.DrawLine(canvas, x - 6, y, x + 6, y, color)
-        graphics.DrawLine(canvas, x - 6, y + 1, x + 6, y + 1, color)
-        graphics.DrawLine(canvas, x - 5, y + 2, x + 5, y + 2, color)
-        graphics.DrawLine(canvas, x - 5, y + 3, x + 5, y + 3, color)
-        graphics.DrawLine(canvas, x - 4, y + 4, x + 4, y + 4, color)
-        graphics.DrawLine(canvas, x - 3, y + 5, x + 3, y + 5, color)
-        graphics.DrawLine(canvas, x - 1, y + 6, x + 1, y + 6, color)
-
-        # # Draw circle with lines
-        # graphics.DrawLine(canvas, x - 2, y - 5, x + 2, y - 5, color)
-        # graphics.DrawLine(canvas, x - 3, y - 4, x + 3, y - 4, color)
-        # graphics.DrawLine(canvas, x - 4, y - 3, x + 4, y - 3, color)
-        # graphics.DrawLine(canvas, x - 5, y - 2, x + 5, y - 2, color)
-        # graphics.DrawLine(canvas, x - 5, y - 1, x + 5, y - 1, color)
-        # graphics.DrawLine(canvas, x - 5, y, x + 5, y, color)
-        # graphics.DrawLine(canvas, x - 5, y + 1, x + 5, y + 1, color)
-        # graphics.DrawLine(canvas, x - 5, y + 2, x + 5, y + 2, color)
-        # graphics.DrawLine(canvas, x - 4, y + 3, x + 4, y + 3, color)
-        # graphics.DrawLine(canvas, x - 3, y + 4, x + 3, y + 4, color)
-        # graphics.DrawLine(canvas, x - 2, y + 5, x + 2, y + 5, color)
+        # loaded in run() once the arguments are parsed
+        self.config = None
+        self.layout = None
+        self.num_rows = 2
+
+        # the fonts decoded for building sprites
+        self.font_bitmap = BdfFont('./fonts/helvR12.bdf')
+        self.circle_font_bitmap = BdfFont('./fonts/6x10.bdf')
+        self.sprites = SpriteCache()
+        self.weather = get_weather_service()
+        # weather icons, drawn at the top left in white
+        self.icons = {icon_file: SpriteBuilder().bitmap(0, 0, mask, (255, 255, 255)).build()
+                      for icon_file, mask in load_icons().items()}
+        # set up in run() once the matrix exists
+        self.renderer = None
+        self.scheduler = None
+        # the stops display_trains is showing
+        self.showing = frozenset()
+        # (page, snapshot, stop_id -> Countdowns) for the page last drawn
+        self.countdowns = None
+        # time.monotonic() --replay started
+        self.replay_started = None
+        PROFILE.mark('load fonts')
+
+    def build_row_sprite(self, x, y, row_ind, text_colour, circle_colour, route_id, direction):
+        # everything on a row but the minutes: "1.", the route bullet and the direction arrow.
+        # x, y is the top left of the stop's tile
+        circle_y = y + 8 + row_ind * ROW_HEIGHT
+        text_y = y + 13 + row_ind * ROW_HEIGHT
+
+        route_id_offset_width = self.circle_font_bitmap.character_width(ord(route_id))
+        route_id_offset = int(route_id_offset_width / 2) - 1
+
+        builder = SpriteBuilder()
+        builder.text(self.font_bitmap, x + 1, text_y, text_colour, f'{row_ind + 1}')
+        builder.text(self.font_bitmap, x + 7, text_y, text_colour, '.')
+        builder.bullet(x + 15, circle_y, circle_colour)
+        builder.text(self.circle_font_bitmap, x + 15 - route_id_offset, text_y - 1, (0, 0, 0), route_id)
+        builder.text(self.circle_font_bitmap, x + 24, text_y - 1, text_colour, '↑' if direction == 'N' else '↓')
+        return builder.build()
 
     def draw_row(self,
-                 canvas,
+                 frame,
+                 x,
+                 y,
                  row_ind,
                  text_colour,
                  circle_colour,
@@ -94,52 +650,29 @@ class DisplayTrains(SampleBase):
                  headsign_text,
                  direction,
                  arrival_mins):
-        # Top line
-        if row_ind == 0:
-            circle_y = 8
-            text_y = 13
-        else:
-            # Bottom line
-            circle_y = 23
-            text_y = 28
+        text_y = y + 13 + row_ind * ROW_HEIGHT
 
-        route_id_offset_width = self.circle_font.CharacterWidth(ord(route_id))
-        route_id_offset = int(route_id_offset_width / 2) - 1
-
-        graphics.DrawText(canvas, self.font, 1, text_y, text_colour, f'{row_ind + 1}')
-        graphics.DrawText(canvas, self.font, 7, text_y, text_colour, f'.')
-        # graphics.DrawCircle(canvas, 16, circle_y, 5, circle_colour)
-        self.draw_filled_circle(canvas, 15, circle_y, circle_colour)
-        graphics.DrawText(canvas, self.circle_font, 15 - route_id_offset, text_y - 1, graphics.Color(0, 0, 0), route_id)
-        # graphics.DrawText(canvas, self.font, 26, text_y, text_colour, headsign_text)
-        if direction == 'N':
-            graphics.DrawText(canvas, self.circle_font, 24, text_y - 1, text_colour, '↑')
-        else:
-            graphics.DrawText(canvas, self.circle_font, 24, text_y - 1, text_colour, '↓')
+        frame.add(self.sprites.get(('row', x, y, row_ind, text_colour, circle_colour, route_id, direction),
+                                   lambda: self.build_row_sprite(x, y, row_ind, text_colour, circle_colour, route_id,
+                                                                 direction)))
         if isinstance(arrival_mins, int):
             minutes_text = f'{arrival_mins:2d}'
-            minutes_width = sum(self.font.CharacterWidth(ord(letter)) for letter in minutes_text)
-            graphics.DrawText(canvas, self.font, 45 - minutes_width, text_y, text_colour, minutes_text)
-            graphics.DrawText(canvas, self.font, 45, text_y, text_colour, "min")
+            minutes_width = self.font_bitmap.text_width(minutes_text)
+            frame.add(self.sprites.text(self.font_bitmap, x + 45 - minutes_width, text_y, text_colour, minutes_text))
+            frame.add(self.sprites.text(self.font_bitmap, x + 45, text_y, text_colour, 'min'))
         else:
-            graphics.DrawText(canvas, self.font, 32, text_y, text_colour, arrival_mins)
+            frame.add(self.sprites.text(self.font_bitmap, x + 32, text_y, text_colour, arrival_mins))
 
-    def draw_train(self, row_ind, train, stop_id, canvas):
-        arrival_mins = arrival_minutes(train, stop_id)
+    def draw_train(self, tile, row_ind, countdown, monotonic_now, frame):
+        train = countdown.arrival.trip
+        arrival_mins = countdown.minutes(monotonic_now)
         # arrival_mins = 0
-        text_colour = self.text_colour
-
-        # see: https://www.6sqft.com/did-you-know-the-mta-uses-pantone-colors-to-distinguish-train-lines/
-        if train.route_id in ['B', 'D', 'F', 'M']:
-            circle_colour = self.circle_colour_bdfm
-        elif train.route_id in ['G', ]:
-            circle_colour = self.circle_colour_g
-        else:
-            circle_colour = self.circle_colour_nqrw
+        text_colour = self.config.text_colour
+        circle_colour = self.config.route_colour(train.route_id)
 
         # 0 mins is arriving
         if arrival_mins <= 0:
-            text_colour = self.text_colour_arriving
+            text_colour = self.config.text_colour_arriving
 
         # one minute late just report as arriving
         if arrival_mins == -1:
@@ -149,170 +682,161 @@ class DisplayTrains(SampleBase):
         if arrival_mins < -1:
             arrival_mins = 'delay'
 
-        if stop_id.endswith('N'):
-            direction = 'N'
-        else:
-            direction = 'S'
-
-        self.draw_row(canvas,
+        self.draw_row(frame,
+                      x=tile.x,
+                      y=tile.y,
                       row_ind=row_ind,
                       text_colour=text_colour,
                       circle_colour=circle_colour,
                       route_id=train.route_id,
                       headsign_text=train.headsign_text,
-                      direction=direction,
+                      direction=self.config.stop_directions[tile.stop_id],
                       arrival_mins=arrival_mins)
 
-    @staticmethod
-    def get_stop_name_and_direction( stop_id):
-        if stop_id.startswith('F23'):
-            stop_name = '4 Av'
-        elif stop_id.startswith('R33'):
-            stop_name = '9 St'
+    def build_header_sprite(self, tile):
+        # station name, direction and the routes that stop there
+        text_y_top = tile.y + 13
 
-        if stop_id.endswith('N'):
-            direction = '↑'
-        else:
-            direction = '↓'
-
-        return stop_name, direction
+        builder = SpriteBuilder()
+        builder.text(self.font_bitmap, tile.x + 1, text_y_top, self.config.text_colour,
+                     self.config.stop_titles[tile.stop_id])
+        routes = self.config.stop_routes[tile.stop_id]
+        route_x = tile.x + 62 - HEADER_ROUTE_SPACING * len(routes)
+        for route_ind, route_id in enumerate(routes):
+            builder.text(self.circle_font_bitmap, route_x + route_ind * HEADER_ROUTE_SPACING, text_y_top - 1,
+                         self.config.route_colour(route_id), route_id)
+        return builder.build()
 
     def draw_no_train_data(self,
-                           stop_id,
-                           canvas,
+                           tile,
+                           frame,
                            ):
-        # Top line
-        text_y_top = 13
-        text_y_bottom = 28
-
-        stop_name, direction = self.get_stop_name_and_direction(stop_id)
-
-        graphics.DrawText(canvas, self.font, 1, text_y_top, self.text_colour, f'{stop_name} {direction}')
-        if stop_id.startswith('F23'):
-            graphics.DrawText(canvas, self.circle_font, 44, text_y_top - 1, self.circle_colour_bdfm, 'F')
-            graphics.DrawText(canvas, self.circle_font, 50, text_y_top - 1, self.circle_colour_g, 'G')
-        else:
-            graphics.DrawText(canvas, self.circle_font, 38, text_y_top - 1, self.circle_colour_nqrw, 'R')
-            graphics.DrawText(canvas, self.circle_font, 44, text_y_top - 1, self.circle_colour_nqrw, 'W')
-            graphics.DrawText(canvas, self.circle_font, 50, text_y_top - 1, self.circle_colour_nqrw, 'N')
-            graphics.DrawText(canvas, self.circle_font, 56, text_y_top - 1, self.circle_colour_bdfm, 'D')
+        text_y_bottom = tile.y + 28
 
-        graphics.DrawText(canvas, self.font, 7, text_y_bottom, self.text_colour, '*no data*')
+        frame.add(self.sprites.get(('header', tile), lambda: self.build_header_sprite(tile)))
+        frame.add(self.sprites.text(self.font_bitmap, tile.x + 7, text_y_bottom, self.config.text_colour,
+                                    '*no data*'))
 
     def draw_no_trains(self,
-                       stop_id,
-                       canvas,
+                       tile,
+                       frame,
                        ):
-        # Top line
-        text_y_top = 13
-        text_y_bottom = 28
+        text_y_bottom = tile.y + 28
 
-        stop_name, direction = self.get_stop_name_and_direction(stop_id)
+        frame.add(self.sprites.get(('header', tile), lambda: self.build_header_sprite(tile)))
+        frame.add(self.sprites.text(self.font_bitmap, tile.x + 3, text_y_bottom, self.config.text_colour,
+                                    '*no trains*'))
 
-        graphics.DrawText(canvas, self.font, 1, text_y_top, self.text_colour, f'{stop_name} {direction}')
-        if stop_id.startswith('F23'):
-            graphics.DrawText(canvas, self.circle_font, 44, text_y_top - 1, self.circle_colour_bdfm, 'F')
-            graphics.DrawText(canvas, self.circle_font, 50, text_y_top - 1, self.circle_colour_g, 'G')
-        else:
-            graphics.DrawText(canvas, self.circle_font, 38, text_y_top - 1, self.circle_colour_nqrw, 'R')
-            graphics.DrawText(canvas, self.circle_font, 44, text_y_top - 1, self.circle_colour_nqrw, 'W')
-            graphics.DrawText(canvas, self.circle_font, 50, text_y_top - 1, self.circle_colour_nqrw, 'N')
-            graphics.DrawText(canvas, self.circle_font, 56, text_y_top - 1, self.circle_colour_bdfm, 'D')
-
-        graphics.DrawText(canvas, self.font, 3, text_y_bottom, self.text_colour, '*no trains*')
-
-    def draw_trains(self, trains, stop_id, canvas):
-        if trains is None:
-            self.draw_no_train_data(stop_id, canvas)
-        elif len(trains):
+    def draw_trains(self, countdowns, tile, monotonic_now, frame):
+        # the Countdowns for the stop in tile, drawn into its part of the frame
+        if countdowns is None:
+            self.draw_no_train_data(tile, frame)
+        elif len(countdowns):
             # check we don't have stale data
-            now = datetime.now()
+            now = CLOCK()
             last_update_time = now - timedelta(minutes=60)
-            for train in trains:
-                if train.last_position_update > last_update_time:
-                    last_update_time = train.last_position_update
+            for countdown in countdowns:
+                # None for a train that hasn't left its terminal yet
+                last_position_update = countdown.arrival.trip.last_position_update
+                if last_position_update is not None and last_position_update > last_update_time:
+                    last_update_time = last_position_update
             # if the latest update was more than 15 minutes ago, the data is stale
             if last_update_time < now - timedelta(minutes=15):
-                self.draw_no_train_data(stop_id, canvas)
+                # counted per frame shown, so it's the time spent showing stale data too
+                METRICS.count('stale_data_frames_total', stop=tile.stop_id)
+                self.draw_no_train_data(tile, frame)
             else:
-                self.draw_train(0, trains[0], stop_id, canvas)
-                if len(trains) > 1:
-                    self.draw_train(1, trains[1], stop_id, canvas)
+                for row_ind, countdown in enumerate(countdowns[:tile.num_rows]):
+                    self.draw_train(tile, row_ind, countdown, monotonic_now, frame)
         else:
-            self.draw_no_trains(stop_id, canvas)
+            self.draw_no_trains(tile, frame)
 
-        return True, canvas
+        return True, frame
 
     def what_should_we_display(self):
-        # return ['trains']
-        # return ['clock', 'trains']
-
-        timestamp = datetime.now().time()
-        # display trains and clock between 7am and 9am
-        if dt_time(7, 0) <= timestamp < dt_time(9, 0):
-            return ['trains, clock']
-        # only trains during the day
-        if dt_time(9, 0) <= timestamp < dt_time(20, 0):
-            return ['trains']
-        # only clok after 8
-        if timestamp >= dt_time(20, 0):
-            return ['clock']
-
-        return ['off']
+        # the screens in the config's schedule for now
+        return self.config.screens_at(CLOCK().time())
+
+    def page_countdowns(self, page):
+        # stop_id -> Countdowns for every tile on the page, from the same snapshot. only rebuilt when
+        # a new snapshot comes in, in between a frame just recomputes the minutes
+        snapshot = SNAPSHOT
+        cached = self.countdowns
+        if cached is not None and cached[0] is page and cached[1] is snapshot:
+            return cached[2]
+
+        now = CLOCK()
+        monotonic_now = MONOTONIC()
+        countdowns = {}
+        for tile in page:
+            if snapshot is None:
+                countdowns[tile.stop_id] = None
+            else:
+                countdowns[tile.stop_id] = tuple(Countdown(arrival, now, monotonic_now)
+                                                 for arrival in snapshot.arrivals.get(tile.stop_id, ())[:tile.num_rows])
+        self.countdowns = page, snapshot, countdowns
+        return countdowns
+
+    def draw_page(self, page, frame):
+        countdowns = self.page_countdowns(page)
+        monotonic_now = MONOTONIC()
+        for tile in page:
+            self.draw_trains(countdowns[tile.stop_id], tile, monotonic_now, frame)
+        return frame
 
     def display_trains(self, canvas):
-        update_feeds()
-        for stop_id in self.stop_ids:
-            trains = get_next_trains(stop_id=stop_id)
-
-            canvas.Clear()
-            success, canvas = self.draw_trains(trains, stop_id, canvas)
-            if success:
-                time.sleep(0.05)
-                canvas = self.matrix.SwapOnVSync(canvas)
-
-            # show display for 10 seconds before update
-            time.sleep(10)
+        # a page of stops at a time, all of them at once if they fit
+        for page in self.layout.pages:
+            self.showing = frozenset(tile.stop_id for tile in page)
+            # redrawn every frame so new data shows straight away, unchanged frames aren't swapped
+            for _ in self.scheduler.frames(self.config.dwell_times['trains']):
+                canvas = self.renderer.show(canvas, self.draw_page(page, Frame()))
+        self.showing = frozenset()
 
         return canvas
 
+    def arrivals_changed(self, stop_ids):
+        # from the refresher, only worth waking up early for the stops on screen
+        if not self.showing.isdisjoint(stop_ids):
+            self.scheduler.wake()
+
     def display_clock(self, canvas):
         text_y_top = 13
         text_y_bottom = 28
         clock_pos = 1
 
-        w, _ = get_weather()
+        weather = self.weather.get()
 
-        start_time = datetime.now()
         show_colon = True
-        while (datetime.now() - start_time).total_seconds() < 10:
-            canvas.Clear()
+        text_colour = self.config.text_colour
+        for _ in self.scheduler.frames(self.config.dwell_times['clock']):
+            frame = Frame()
 
-            current_time = datetime.now()
+            current_time = CLOCK()
 
             # draw time
-            graphics.DrawText(canvas, self.font, clock_pos, text_y_top, self.text_colour,
-                              current_time.strftime('%H'))
+            frame.add(self.sprites.text(self.font_bitmap, clock_pos, text_y_top, text_colour,
+                                        current_time.strftime('%H')))
             if show_colon:
-                graphics.DrawText(canvas, self.font, clock_pos + 14, text_y_top - 1, self.text_colour, ':')
-            graphics.DrawText(canvas, self.font, clock_pos + 17, text_y_top, self.text_colour,
-                              current_time.strftime('%M'))
+                frame.add(self.sprites.text(self.font_bitmap, clock_pos + 14, text_y_top - 1, text_colour, ':'))
+            frame.add(self.sprites.text(self.font_bitmap, clock_pos + 17, text_y_top, text_colour,
+                                        current_time.strftime('%M')))
 
             # draw temp
-            if w is not None:
-                graphics.DrawText(canvas, self.circle_font, clock_pos + 44, text_y_top - 1, self.text_colour,
-                                  f'{k_to_c(w.temp["temp"]):d}c')
+            if weather is not None:
+                frame.add(self.sprites.text(self.circle_font_bitmap, clock_pos + 44, text_y_top - 1, text_colour,
+                                            f'{weather.temp:d}c'))
             else:
-                graphics.DrawText(canvas, self.circle_font, clock_pos + 44, text_y_top - 1, self.text_colour,
-                                  '--c')
+                frame.add(self.sprites.text(self.circle_font_bitmap, clock_pos + 44, text_y_top - 1, text_colour,
+                                            '--c'))
 
             # draw date
             date_str = current_time.strftime('%a ') + f'{current_time.day} ' + current_time.strftime('%b')
-            graphics.DrawText(canvas, self.font, 1, text_y_bottom, self.text_colour, date_str)
+            frame.add(self.sprites.text(self.font_bitmap, 1, text_y_bottom, text_colour, date_str))
 
-            canvas = self.matrix.SwapOnVSync(canvas)
+            # only the colon and the digits that changed get redrawn
+            canvas = self.renderer.show(canvas, frame)
             show_colon = not show_colon
-            time.sleep(0.5)
 
         return canvas
 
@@ -321,36 +845,90 @@ class DisplayTrains(SampleBase):
         text_y_middle = 20
         text_y_bottom = 30
 
-        timestamp = datetime.now().time()
+        weather = self.weather.get()
+
+        timestamp = CLOCK().time()
         if timestamp < dt_time(13, 0):  # before 12 show today's forecast
-            min_temp, max_temp, icon_file = todays_forecast()
+            forecast = weather.today if weather is not None else None
             head_str = 'Today'
         elif timestamp < dt_time(19, 0):  # before 7pm show the evening forecast
-            min_temp, max_temp, icon_file = evening_forecast()
+            forecast = weather.evening if weather is not None else None
             head_str = 'Eve'
         else:
-            min_temp, max_temp, icon_file = tomorrows_forecast()
+            forecast = weather.tomorrow if weather is not None else None
             head_str = 'Tom'
 
-        canvas.Clear()
-
-        im = Image.open(icon_file)
-
-        graphics.DrawText(canvas, self.circle_font, 32, text_y_top, self.text_colour, head_str)
-        graphics.DrawText(canvas, self.circle_font, 32, text_y_middle, self.text_colour,
-                          f'↓{min_temp}c')
-        graphics.DrawText(canvas, self.circle_font, 32, text_y_bottom, self.text_colour,
-                          f'↑{max_temp}c')
-        canvas.SetImage(im)
-
-        canvas = self.matrix.SwapOnVSync(canvas)
-        time.sleep(10)
+        if forecast is not None:
+            min_temp, max_temp, icon_file = forecast
+        else:
+            # nothing from OpenWeatherMap yet
+            min_temp, max_temp, icon_file = '--', '--', 'icons/32/sun.xbm'
+
+        text_colour = self.config.text_colour
+        frame = Frame()
+        frame.add(self.icons[icon_file])
+        frame.add(self.sprites.text(self.circle_font_bitmap, 32, text_y_top, text_colour, head_str))
+        frame.add(self.sprites.text(self.circle_font_bitmap, 32, text_y_middle, text_colour, f'↓{min_temp}c'))
+        frame.add(self.sprites.text(self.circle_font_bitmap, 32, text_y_bottom, text_colour, f'↑{max_temp}c'))
+
+        canvas = self.renderer.show(canvas, frame)
+        self.scheduler.sleep(self.config.dwell_times['weather'])
         return canvas
 
+    def first_frame_shown(self):
+        PROFILE.mark('first frame')
+        if self.args.profile_startup:
+            PROFILE.report()
+
     def run(self):
-        canvas = self.matrix.CreateFrameCanvas()
+        global CAPTURE_DIR
 
-        graceful_killer = GracefulKiller()
+        PROFILE.mark('matrix setup')
+        CAPTURE_DIR = self.args.capture
+        self.config = load_config(self.args.config, self.stop_ids)
+        stop_ids = self.config.stop_ids
+        PROFILE.mark('load config')
+        canvas = self.matrix.CreateFrameCanvas()
+        self.renderer = FrameRenderer(self.matrix, on_first_frame=self.first_frame_shown)
+
+        # as many stops side by side and train rows as fit on the (possibly chained) panels
+        self.layout = Layout(self.matrix.width, self.matrix.height, stop_ids)
+        self.num_rows = self.layout.num_rows
+
+        if self.args.headless and self.args.replay is None:
+            self.run_headless(canvas)
+            return
+
+        replay_seconds = None
+        if self.args.replay is not None:
+            replay_seconds = self.start_replay()
+
+        self.scheduler = Scheduler(fps=self.args.fps)
+        metrics_server = None
+        if self.args.metrics_port is not None:
+            metrics_server = start_metrics_server(self.args.metrics_port, self.args.metrics_address)
+        if replay_seconds is None:
+            # the arrivals last saved give the first frame something to show without waiting on
+            # nyct_gtfs. the cached feeds behind them are restored by the refresher
+            restore_arrivals(stop_ids, depth=self.num_rows)
+            PROFILE.mark('restore saved arrivals')
+        if self.args.fetch_process:
+            fetcher_metrics = None
+            if metrics_server is not None:
+                fetcher_metrics = (self.args.metrics_port + 1, self.args.metrics_address)
+            refresher = FetcherProcess(stop_ids, depth=self.num_rows, on_update=self.arrivals_changed,
+                                       metrics=fetcher_metrics, config=self.config, capture_dir=CAPTURE_DIR)
+        else:
+            refresher = FeedRefresher(stop_ids, depth=self.num_rows, on_update=self.arrivals_changed,
+                                      config=self.config, restore=replay_seconds is None)
+        refresher.start()
+
+        graceful_killer = GracefulKiller(self.scheduler)
+        if replay_seconds is not None:
+            # stop once the captures have played out
+            replay_end = threading.Timer(replay_seconds, graceful_killer.exit_gracefully, args=(None, None))
+            replay_end.daemon = True
+            replay_end.start()
         while not graceful_killer.kill_now:
             display_items = self.what_should_we_display()
             for display_item in display_items:
@@ -363,27 +941,137 @@ class DisplayTrains(SampleBase):
                 else:
                     # nothing
                     canvas.Clear()
-                    time.sleep(600)  # check again in 10 mins
+                    self.renderer.invalidate()
+                    self.scheduler.sleep(self.config.dwell_times['off'])  # check again in 10 mins
+
+        refresher.stop()
+        if replay_seconds is not None:
+            self.report_replay()
+        if metrics_server is not None:
+            metrics_server.shutdown()
+
+    def start_replay(self):
+        # swaps the MTA for the captures in --replay and the clock for a virtual one starting at the
+        # first capture, returns the real seconds the replay will take
+        global CLOCK, MONOTONIC, SPEED, FETCH_ENGINE, FEED_CACHE_DIR
+
+        if self.args.fetch_process:
+            self.parser.error('--replay fetches in the display process, drop --fetch-process')
+        if not 1 <= self.args.replay_speed <= 100:
+            self.parser.error('--replay-speed must be between 1 and 100')
+
+        engine = ReplayEngine(self.args.replay, self.args.replay_speed)
+        FETCH_ENGINE = engine
+        CLOCK = engine.clock.now
+        MONOTONIC = engine.clock.monotonic
+        SPEED = self.args.replay_speed
+        # old feeds mustn't replace the live ones in the cache
+        FEED_CACHE_DIR = None
+        # no OpenWeatherMap in the captures
+        self.weather = WeatherService()
+        self.replay_started = time.monotonic()
+        print(f'Replaying {self.args.replay} from {engine.start:%Y-%m-%d %H:%M:%S} to {engine.end:%H:%M:%S} '
+              f'at {SPEED:g}x')
+        return (engine.end - engine.start).total_seconds() / SPEED
+
+    def report_replay(self):
+        print(f'Replayed {timedelta(seconds=round(MONOTONIC()))} in {time.monotonic() - self.replay_started:.1f}s: '
+              f'{METRICS.total("frames_total")} frames, {METRICS.total("frames_skipped_total")} unchanged, '
+              f'{METRICS.total("stale_data_frames_total")} stale, '
+              f'{METRICS.total("feed_fetched_bytes_total")} feed bytes loaded')
+
+    def headless_screens(self, canvas):
+        # yields (name, canvas) after drawing each screen once: every page of trains, the clock and the weather
+        for page in self.layout.pages:
+            canvas = self.renderer.show(canvas, self.draw_page(page, Frame()))
+            yield 'trains-' + '-'.join(tile.stop_id for tile in page), canvas
+        canvas = self.display_clock(canvas)
+        yield 'clock', canvas
+        canvas = self.display_weather(canvas)
+        yield 'weather', canvas
+
+    def run_headless(self, canvas):
+        # renders every screen from the recorded feeds at the time they were recorded, checks the
+        # frames against the golden ones, then times --frames full redraws
+        global CLOCK, MONOTONIC
+
+        if hasattr(time, 'tzset'):
+            os.environ['TZ'] = FIXTURES_TZ
+            time.tzset()
+        recorded_at = load_recorded_feeds(self.args.fixtures, self.config.stop_ids, depth=self.num_rows)
+        CLOCK = lambda: recorded_at
+        MONOTONIC = lambda: 0.0
+        # no OpenWeatherMap, the weather screens always show the same --c
+        self.weather = WeatherService()
+        self.scheduler = SingleFrameScheduler()
+        print(f'Rendering {self.args.fixtures} as of {recorded_at:%Y-%m-%d %H:%M:%S}')
+
+        os.makedirs(self.args.golden, exist_ok=True)
+        mismatched = []
+        for name, canvas in self.headless_screens(canvas):
+            pixels = self.matrix.screen()
+            golden_file = os.path.join(self.args.golden, f'{name}.png')
+            if self.args.update_golden:
+                Image.fromarray(pixels, 'RGB').save(golden_file)
+                print(f'  {name}: saved')
+                continue
+            try:
+                with Image.open(golden_file) as image:
+                    golden = np.asarray(image.convert('RGB'))
+            except FileNotFoundError:
+                print(f'  {name}: no golden frame, run with --update-golden')
+                mismatched.append(name)
+                continue
+            if golden.shape != pixels.shape:
+                print(f'  {name}: golden frame is {golden.shape[1]}x{golden.shape[0]}, '
+                      f'rendered {pixels.shape[1]}x{pixels.shape[0]}')
+                mismatched.append(name)
+            elif not np.array_equal(golden, pixels):
+                # saved next to the golden frame to compare by eye
+                Image.fromarray(pixels, 'RGB').save(os.path.join(self.args.golden, f'{name}.actual.png'))
+                print(f'  {name}: {np.count_nonzero((golden != pixels).any(axis=2))} pixels differ')
+                mismatched.append(name)
+            else:
+                print(f'  {name}: ok')
+
+        frame_times = []
+        start = time.perf_counter()
+        while len(frame_times) < self.args.frames:
+            frame_start = time.perf_counter()
+            for _, canvas in self.headless_screens(canvas):
+                now = time.perf_counter()
+                frame_times.append(now - frame_start)
+                frame_start = now
+                # a full redraw every frame, the same screen twice in a row would be skipped as unchanged
+                self.renderer.invalidate()
+        elapsed = time.perf_counter() - start
+        frame_times = np.asarray(frame_times) * 1000
+        p50, p99 = np.percentile(frame_times, (50, 99))
+        print(f'{len(frame_times)} frames in {elapsed:.2f}s, {len(frame_times) / elapsed:.0f} fps, '
+              f'p50={p50:.3f}ms p99={p99:.3f}ms max={frame_times.max():.3f}ms')
+
+        if mismatched:
+            raise SystemExit(f'{len(mismatched)} frames differ from {self.args.golden}: {", ".join(mismatched)}')
 
 
 def arrival_time(train, stop_id):
     if train.location_status == 'STOPPED_AT' and train.location == stop_id:
-        return datetime(9999, 1, 1, 0, 0, 0)
+        return NO_ARRIVAL
     return next((stu.arrival for stu in train.stop_time_updates
-                 if stu.stop_id == stop_id), datetime(9999, 1, 1, 0, 0, 0))
+                 if stu.stop_id == stop_id), NO_ARRIVAL)
 
 
-def arrival_minutes(train, stop_id):
-    t = arrival_time(train, stop_id)
+def arrival_minutes(t):
     tdelta = t - NOW
     arrival_mins = int(tdelta.total_seconds() / 60)
     return arrival_mins
 
 
 def find_next_trains(trains, num_trains, stop_id):
-    arrival_times = [arrival_time(train, stop_id) for train in trains]
-    train_order = sorted(range(len(arrival_times)), key=lambda k: arrival_times[k])
-    return [trains[train_order[i]] for i in range(num_trains) if len(train_order) > i]
+    # trains can be any iterable, each arrival is computed once and only num_trains are kept
+    next_arrivals = NextArrivals(num_trains)
+    next_arrivals.extend(Arrival(arrival_time(train, stop_id), train) for train in trains)
+    return list(next_arrivals.arrivals())
 
 
 def get_next_trains(
@@ -392,170 +1080,344 @@ def get_next_trains(
 ):
     # time from now
     global NOW
-    NOW = datetime.now()
-    # get all feeds
-    feeds = get_mta_feeds()
-    if feeds is not None:
-        all_trains = []
-        for feed in feeds:
-            all_trains.extend(feed.filter_trips(headed_for_stop_id=stop_id))
-        return find_next_trains(all_trains, num_trains, stop_id)
+    NOW = CLOCK()
+    # read the latest snapshot once, the refresher may swap in a new one at any time
+    snapshot = SNAPSHOT
+    if snapshot is not None:
+        return list(snapshot.arrivals.get(stop_id, ())[:num_trains])
     else:
         return None
 
 
-def get_mta_feeds():
-    import requests
-    global FEEDS
-
-    if FEEDS is None:
-        try:
-            FEEDS = [
-                NYCTFeed("F"),
-                NYCTFeed("G"),
-                NYCTFeed("R"),
-            ]
-        except requests.exceptions.ConnectionError as e:
-            warnings.warn(f'ConnectionError: {e}')
-            return None
-
-    return FEEDS
-
-
-def update_feeds():
-    import requests
-
-    # update all feeds
-    feeds = get_mta_feeds()
-    if feeds is not None:
-        for feed in feeds:
-            try:
-                feed.refresh()
-            except requests.exceptions.ConnectionError as e:
-                warnings.warn(f'ConnectionError: {e}')
-                pass
-
-
-def display_trains(trains, stop_id):
-    for i, train in enumerate(trains):
-        arrival_mins = arrival_minutes(train, stop_id)
-        print(f'{i + 1}. {train.route_id} {train.headsign_text: <20s} {arrival_mins:2d}min')
-    print()
-
-
-def k_to_c(k):
-    return round(k - 273.15)
+def trip_arrival_times(train, stop_ids=None):
+    # (stop_id, time) for each of stop_ids the train is due at, the first time if it's due more than once
+    # a train standing at the stop is treated as already gone, as in arrival_time
+    stopped_at = train.location if train.location_status == 'STOPPED_AT' else None
+    seen = set()
+    for stu in train.stop_time_updates:
+        if stu.stop_id in seen or (stop_ids is not None and stu.stop_id not in stop_ids):
+            continue
+        seen.add(stu.stop_id)
+        if stu.stop_id == stopped_at or stu.arrival is None:
+            yield stu.stop_id, NO_ARRIVAL
+        else:
+            yield stu.stop_id, stu.arrival
 
 
-def weather_to_icon(weather):
-    is_day = weather.weather_icon_name.endswith('d')
+def build_arrival_index(feed_trips, depth=None, feed_stop_ids=None):
+    # stop_id -> arrivals sorted by time, from scratch. with a depth only that many arrivals are kept
+    # per stop, with feed_stop_ids each feed is only indexed for the stops it serves
+    if feed_stop_ids is None:
+        feed_stop_ids = [None] * len(feed_trips)
 
-    if weather.weather_code in [201, 202]:
-        icon_file = 'icons/32/rain_lightning.xbm'
-    elif weather.weather_code in [200, 210, 211, 212, 221, 230, 231, 232]:
-        icon_file = 'icons/32/lightning.xbm'
+    index = ArrivalIndex(depth)
+    for feed_ind, (trips, stop_ids) in enumerate(zip(feed_trips, feed_stop_ids)):
+        index.update(feed_ind, trips, stop_ids)
+    return index.arrivals
 
-    elif weather.weather_code in [300, 301, 302, 310, 311, 312, 313, 314, 321]:
-        icon_file = 'icons/32/rain0.xbm'
 
-    elif weather.weather_code in [500, 501, ]:
-        icon_file = 'icons/32/rain1.xbm'
+def load_stop_routes(path=STOP_ROUTES_FILE):
+    return {station: routes for station, (_, routes) in load_stations(path).items()}
 
-    elif weather.weather_code in [502, 503, 504]:
-        icon_file = 'icons/32/rain2.xbm'
 
-    elif weather.weather_code in [511, 611, 612, 613, 615, 616, ]:
-        icon_file = 'icons/32/rain_snow.xbm'
+def feeds_for_stops(stop_ids):
+    # feed url -> the stop_ids it has trains for, several routes share one feed
+    stop_routes = load_stop_routes()
+    feed_stops = {}
+    for stop_id in stop_ids:
+        routes = stop_routes.get(station_id(stop_id))
+        if routes is None:
+            warnings.warn(f'No routes known for {stop_id}, checking the default feeds')
+            routes = DEFAULT_FEED_ROUTES
+        for route in routes:
+            url = lazy_import('nyct_gtfs').NYCTFeed._train_to_url.get(route)
+            if url is None:
+                warnings.warn(f'No realtime feed for route {route}')
+                continue
+            feed_stops.setdefault(url, set()).add(stop_id)
 
-    elif weather.weather_code in [520, 521, 522, 531]:
-        if is_day:
-            icon_file = 'icons/32/rain1_sun.xbm'
-        else:
-            icon_file = 'icons/32/rain1_moon.xbm'
+    return feed_stops
 
-    elif weather.weather_code in [600, 601, 602, ]:
-        icon_file = 'icons/32/snow.xbm'
 
-    elif weather.weather_code in [620, 621, 622, ]:
-        if is_day:
-            icon_file = 'icons/32/snow_sun.xbm'
-        else:
-            icon_file = 'icons/32/snow_moon.xbm'
-
-    elif weather.weather_code in [701, 711, 721, 731, 741, 751, 761, 762, 771, 781]:
-        icon_file = 'icons/32/cloud_wind.xbm.xbm'
+def get_mta_feeds(stop_ids=None):
+    global FEEDS
 
-    elif weather.weather_code in [800]:
-        if is_day:
-            icon_file = 'icons/32/sun.xbm'
-        else:
-            icon_file = 'icons/32/moon.xbm'
-    elif weather.weather_code in [801]:
-        if is_day:
-            icon_file = 'icons/32/cloud_sun.xbm'
+    if FEEDS is None:
+        if stop_ids is None:
+            # the feeds we have always shown
+            FEEDS = [ConditionalFeed(route) for route in DEFAULT_FEED_ROUTES]
         else:
-            icon_file = 'icons/32/cloud_moon.xbm'
-    elif weather.weather_code in [802]:
-        icon_file = 'icons/32/cloud.xbm'
-    elif weather.weather_code in [803, 804]:
-        icon_file = 'icons/32/clouds.xbm'
-
-    else:
-        icon_file = 'icons/32/sun.xbm'
-
-    return icon_file
-
-
-def get_weather():
-    return None, None
+            # only the feeds that serve our stops, the refresher fetches them
+            FEEDS = [ConditionalFeed(url, stop_ids=frozenset(feed_stop_ids))
+                     for url, feed_stop_ids in feeds_for_stops(stop_ids).items()]
 
-    global WEATHER
-    global FORECAST
-    global WEATHER_TIMESTAMP
-
-    # we only get the weather every 4 hours
-    if WEATHER_TIMESTAMP is None or \
-            (datetime.now() - WEATHER_TIMESTAMP).total_seconds() / 3600 > 4:
-        observation = mgr.weather_at_place('New York')
-        WEATHER = observation.weather
-        FORECAST = mgr.forecast_at_place('New York', '3h')
-        WEATHER_TIMESTAMP = datetime.now()
+    return FEEDS
 
-    return WEATHER, FORECAST
 
+def lazy_import(name):
+    # imports a module the first time it's needed, noting how long it took for --profile-startup
+    module = sys.modules.get(name)
+    if module is None:
+        start = time.perf_counter()
+        module = importlib.import_module(name)
+        PROFILE.add_import(name, time.perf_counter() - start)
+    return module
 
-def todays_forecast():
-    min_temp = 0
-    max_temp = 20
-    icon = 'icons/32/sun.xbm'
 
-    w, forecast = get_weather()
-    max_temp = k_to_c(w.temp['temp'])
-    min_temp = max_temp
-    icon = weather_to_icon(w)
+def new_nyct_feed(feed_specifier):
+    global STATIC_GTFS
 
-    return min_temp, max_temp, icon
+    NYCTFeed = lazy_import('nyct_gtfs').NYCTFeed
+    if STATIC_GTFS is None:
+        feed = NYCTFeed(feed_specifier, fetch_immediately=False)
+        STATIC_GTFS = feed._trip_shapes, feed._stops
+    else:
+        # empty files skip parsing the static GTFS again, the first feed's tables are shared instead
+        feed = NYCTFeed(feed_specifier, fetch_immediately=False, trips_txt=io.StringIO(), stops_txt=io.StringIO())
+        feed._trip_shapes, feed._stops = STATIC_GTFS
+    return feed
+
+
+def get_fetch_engine():
+    global FETCH_ENGINE
+
+    # one pooled client keeps the connections to the MTA and OpenWeatherMap alive between polls
+    with FETCH_ENGINE_LOCK:
+        if FETCH_ENGINE is None:
+            FETCH_ENGINE = lazy_import('fetch').FetchEngine()
+    return FETCH_ENGINE
+
+
+def read_varint(data, pos):
+    result = 0
+    shift = 0
+    while True:
+        b = data[pos]
+        pos += 1
+        result |= (b & 0x7f) << shift
+        if not b & 0x80:
+            return result, pos
+        shift += 7
+
+
+def feed_header_timestamp(data):
+    # reads FeedMessage.header.timestamp straight off the protobuf wire format,
+    # the header is field 1 and is serialised before any of the trips
+    try:
+        key, pos = read_varint(data, 0)
+        if key != (1 << 3 | 2):
+            return None
+        length, pos = read_varint(data, pos)
+        end = pos + length
+        while pos < end:
+            key, pos = read_varint(data, pos)
+            field, wire_type = key >> 3, key & 7
+            if wire_type == 0:
+                value, pos = read_varint(data, pos)
+                if field == 3:
+                    return value
+            elif wire_type == 1:
+                pos += 8
+            elif wire_type == 2:
+                length, pos = read_varint(data, pos)
+                pos += length
+            elif wire_type == 5:
+                pos += 4
+            else:
+                return None
+    except IndexError:
+        return None
+    return None
 
 
-def evening_forecast():
-    min_temp = 0
-    max_temp = 20
-    icon = 'icons/32/sun.xbm'
+def refresh_feed(feed, response):
+    # response is what the fetch engine got for feed, an httpx.Response or a FetchError
+    if isinstance(response, Exception):
+        METRICS.count('feed_errors_total', feed=feed.feed_id, error=type(response).__name__)
+        warnings.warn(f'{type(response).__name__}: {response}')
+        feed.failed()
+        return None
 
-    w, forecast = get_weather()
-    max_temp = k_to_c(w.temp['temp'])
-    min_temp = max_temp
-    icon = weather_to_icon(w)
+    try:
+        changed = feed.handle(response)
+    except RuntimeError as e:
+        # non-200 from the MTA, don't let it kill the refresher thread
+        METRICS.count('feed_errors_total', feed=feed.feed_id, error='status')
+        warnings.warn(f'RuntimeError: {e}')
+        feed.failed()
+        return None
+    except Exception as e:
+        # a 200 that isn't a feed, e.g. an HTML error page from a proxy
+        METRICS.count('feed_errors_total', feed=feed.feed_id, error='parse')
+        warnings.warn(f'Could not parse {feed.feed_id}: {e!r}')
+        feed.failed()
+        return None
+    feed.succeeded()
+    return changed
+
+
+def update_feeds(stop_ids=None, depth=None):
+    # update all feeds in parallel, returns the stop_ids whose arrivals changed
+    feeds = get_mta_feeds(stop_ids)
+    if feeds:
+        # feeds backing off after errors sit this one out
+        due = [feed for feed in feeds if feed.retry_at <= MONOTONIC()]
+        # fetched concurrently, then parsed one after the other
+        responses = dict(zip(due, get_fetch_engine().get_many([feed.request() for feed in due])))
+        changed = [refresh_feed(feed, responses[feed]) if feed in responses else None for feed in feeds]
+
+        if SNAPSHOT is None:
+            # nothing to show until at least one feed has loaded
+            if all(feed_changed is None for feed_changed in changed):
+                return set()
+        elif not any(changed):
+            # nothing new, keep the current snapshot and index
+            return set()
+
+        changed = publish_snapshot(feeds, depth)
+        if changed:
+            save_arrivals(stop_ids, depth)
+        return changed
+
+    return set()
+
+
+def arrivals_file(stop_ids, depth):
+    return ArrivalsFile(os.path.join(FEED_CACHE_DIR, ARRIVALS_FILE), stop_ids, depth, NO_ARRIVAL)
+
+
+def save_arrivals(stop_ids, depth):
+    if FEED_CACHE_DIR is None or stop_ids is None or depth is None:
+        return
+    snapshot = SNAPSHOT
+    try:
+        arrivals_file(stop_ids, depth).write(snapshot.timestamp, snapshot.arrivals)
+    except OSError as e:
+        warnings.warn(f'Could not save arrivals: {e}')
+
+
+def restore_arrivals(stop_ids, depth):
+    # publishes the arrivals saved by the last refresh, without nyct_gtfs or parsing a feed. returns
+    # True if there were any for these stops, the stale data check in draw_trains covers old ones
+    try:
+        saved = arrivals_file(stop_ids, depth).read()
+    except Exception as e:
+        warnings.warn(f'Could not load saved arrivals: {e}')
+        return False
+    if saved is None:
+        return False
+    publish_shared_snapshot(*saved)
+    return True
+
+
+def publish_snapshot(feeds, depth=None):
+    # only feeds with new trips are diffed against the index, feeds that failed to refresh keep
+    # their arrivals there. returns the stop_ids whose arrivals changed
+    global SNAPSHOT, ARRIVAL_INDEX
+
+    if ARRIVAL_INDEX is None:
+        ARRIVAL_INDEX = ArrivalIndex(depth)
+
+    changed = set()
+    for feed in feeds:
+        trips = feed.take_trips()
+        if trips is not None:
+            changed |= ARRIVAL_INDEX.update(feed.feed_id, trips, feed.stop_ids)
+
+    if SNAPSHOT is not None and not changed:
+        return changed
+    # unchanged stops share their arrivals with the previous snapshot
+    SNAPSHOT = FeedSnapshot(timestamp=CLOCK(), arrivals=dict(ARRIVAL_INDEX.arrivals))
+    return changed
+
+
+def restore_feeds(stop_ids=None, depth=None):
+    # publish whatever we cached last time, the stale data check in draw_trains covers old copies
+    feeds = get_mta_feeds(stop_ids)
+    restored = [feed.restore() for feed in feeds]
+    if any(restored):
+        publish_snapshot(feeds, depth)
+        return True
+    return False
+
+
+def load_recorded_feeds(fixtures_dir, stop_ids=None, depth=None):
+    # publishes the feeds recorded in fixtures_dir, returns when the newest of them was generated
+    feeds = get_mta_feeds(stop_ids)
+    loaded = []
+    for feed in feeds:
+        try:
+            with open(os.path.join(fixtures_dir, f'{feed.feed_id}.pb'), 'rb') as fp:
+                loaded.append(feed.load(fp.read()))
+        except FileNotFoundError:
+            warnings.warn(f'No recording of {feed.feed_id} in {fixtures_dir}')
+            loaded.append(False)
+    if not any(loaded):
+        raise SystemExit(f'No recorded feeds in {fixtures_dir}, run benchmark.py --record or --synthetic first')
+
+    publish_snapshot(feeds, depth)
+    return datetime.fromtimestamp(max(feed.header_timestamp for feed, feed_loaded in zip(feeds, loaded)
+                                      if feed_loaded and feed.header_timestamp is not None))
+
+
+def run_fetcher(table, updated, stop_event, metrics=None, config=None, capture_dir=None):
+    # the fetcher process, publishes each new snapshot into table. metrics is a (port, address) to
+    # serve the feed metrics on, they're collected in this process. config's schedule paces the polls
+    global CAPTURE_DIR, FEEDS, FETCH_ENGINE, FETCH_ENGINE_LOCK, SNAPSHOT, ARRIVAL_INDEX
+
+    # Ctrl-C reaches the whole process group, the display process stops us through stop_event
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    # a restart is forked from the display process once it's running, so drop what it left behind.
+    # its fetch engine's event loop thread doesn't exist here, and GracefulKiller would swallow SIGTERM
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    FEEDS = None
+    FETCH_ENGINE = None
+    # another thread might have held it when we were forked
+    FETCH_ENGINE_LOCK = threading.Lock()
+    SNAPSHOT = None
+    ARRIVAL_INDEX = None
+    CAPTURE_DIR = capture_dir
+    if metrics is not None:
+        start_metrics_server(*metrics)
+
+    def write_snapshot(changed=None):
+        snapshot = SNAPSHOT
+        table.write(snapshot.timestamp, snapshot.arrivals)
+        updated.set()
+
+    FeedRefresher(table.stop_ids, depth=table.depth, on_update=write_snapshot, stop_event=stop_event,
+                  config=config, restore=True).run()
+
+
+def publish_shared_snapshot(timestamp, arrivals):
+    # arrivals read back from a SharedArrivals or ArrivalsFile table. returns the stop_ids whose
+    # arrivals changed since what was last published
+    global SNAPSHOT
+
+    previous = SNAPSHOT
+    if previous is not None and previous.timestamp == timestamp:
+        return set()
+    arrivals = {stop_id: tuple(Arrival._make(entry) for entry in entries) for stop_id, entries in arrivals.items()}
+    SNAPSHOT = FeedSnapshot(timestamp=timestamp, arrivals=arrivals)
+    if previous is None:
+        return set(arrivals)
+    return {stop_id for stop_id, entries in arrivals.items() if previous.arrivals.get(stop_id) != entries}
 
-    return min_temp, max_temp, icon
 
+def display_trains(trains, stop_id):
+    for i, arrival in enumerate(trains):
+        train = arrival.trip
+        arrival_mins = arrival_minutes(arrival.time)
+        print(f'{i + 1}. {train.route_id} {train.headsign_text: <20s} {arrival_mins:2d}min')
+    print()
 
-def tomorrows_forecast():
-    min_temp = 0
-    max_temp = 20
-    icon = 'icons/32/sun.xbm'
 
-    return min_temp, max_temp, icon
+def get_weather_service():
+    # weather needs an OpenWeatherMap key, without one the clock just shows --c
+    api_key = os.environ.get('OWM_API_KEY')
+    if api_key is None:
+        return WeatherService()
+    return WeatherService(api_key, get_fetch_engine)
 
 
 def main():
@@ -571,8 +1433,9 @@ def main():
     # r_trains = get_next_trains(stop_id='R33N')
     # display_trains(r_trains, stop_id='R33N')
 
-    get_mta_feeds()
-    led_display_trains = DisplayTrains(['F23N', 'F23S', 'R33N', 'R23S'])
+    PROFILE.mark('imports')
+    # the stops shown are in config.json
+    led_display_trains = DisplayTrains()
     # led_display_trains = DisplayTrains(['F23S', ])
     led_display_trains.process()
 
@@ -0,0 +1,136 @@
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import threading
+import time
+
+# Counters, gauges and timings from the display loop and the feed refresher, served as Prometheus
+# text on /metrics with --metrics-port so we can see which Pi in the fleet is falling behind.
+# Timings keep their last SAMPLE_WINDOW samples in a ring buffer for the quantiles.
+
+SAMPLE_WINDOW = 512
+QUANTILES = (0.5, 0.9, 0.99)
+
+
+class Summary:
+    def __init__(self, window=SAMPLE_WINDOW):
+        self.count = 0
+        self.sum = 0.0
+        self.samples = deque(maxlen=window)
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        self.samples.append(value)
+
+    def quantiles(self):
+        samples = sorted(self.samples)
+        if not samples:
+            return []
+        return [(q, samples[min(int(q * len(samples)), len(samples) - 1)]) for q in QUANTILES]
+
+
+class Timer:
+    # with METRICS.timer('name'): ... observes how long the block took, in seconds
+    def __init__(self, metrics, name, labels):
+        self.metrics = metrics
+        self.name = name
+        self.labels = labels
+        self.start = None
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.metrics.observe(self.name, time.perf_counter() - self.start, **self.labels)
+
+
+class Metrics:
+    def __init__(self):
+        self.lock = threading.Lock()
+        # (name, labels) -> value or Summary, labels a sorted tuple of (label, value)
+        self.counters = {}
+        self.gauges = {}
+        self.summaries = {}
+
+    def count(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.gauges[key] = value
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            summary = self.summaries.get(key)
+            if summary is None:
+                summary = self.summaries[key] = Summary()
+            summary.observe(value)
+
+    def total(self, name):
+        # a counter summed over all its labels
+        with self.lock:
+            return sum(value for (counter, _), value in self.counters.items() if counter == name)
+
+    def timer(self, name, **labels):
+        return Timer(self, name, labels)
+
+    def render(self):
+        lines = []
+        with self.lock:
+            for kind, values in (('counter', self.counters), ('gauge', self.gauges)):
+                typed = set()
+                for (name, labels), value in sorted(values.items()):
+                    if name not in typed:
+                        lines.append(f'# TYPE {name} {kind}')
+                        typed.add(name)
+                    lines.append(f'{name}{format_labels(labels)} {value}')
+
+            typed = set()
+            for (name, labels), summary in sorted(self.summaries.items()):
+                if name not in typed:
+                    lines.append(f'# TYPE {name} summary')
+                    typed.add(name)
+                for q, value in summary.quantiles():
+                    lines.append(f'{name}{format_labels(labels + (("quantile", q),))} {value}')
+                lines.append(f'{name}_sum{format_labels(labels)} {summary.sum}')
+                lines.append(f'{name}_count{format_labels(labels)} {summary.count}')
+        return '\n'.join(lines) + '\n'
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in labels)
+    return '{' + ','.join(f'{label}="{value}"' for (label, _), value in zip(labels, escaped)) + '}'
+
+
+METRICS = Metrics()
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = METRICS.render().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # every scrape would otherwise end up in matrix_err.log
+        pass
+
+
+def start_metrics_server(port, address='127.0.0.1'):
+    server = ThreadingHTTPServer((address, port), MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='metrics-server', daemon=True).start()
+    return server
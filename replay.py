@@ -0,0 +1,88 @@
+from bisect import bisect_right
+from collections import namedtuple
+from datetime import datetime, timedelta
+import glob
+import os
+import time
+from urllib.parse import unquote, urlparse
+
+# Plays back feeds captured with main.py --capture DIR in place of the MTA (main.py --replay DIR),
+# on a virtual clock that can run up to 100x faster than real time. A capture is every version of
+# each feed the refresher loaded, saved as DIR/<feed id>/<header timestamp>.pb.
+#
+# ReplayEngine stands in for the fetch.FetchEngine, answering each feed request with the latest
+# capture as of the virtual time, so replayed feeds go through the same conditional requests,
+# parsing and arrival index as live ones.
+
+ReplayResponse = namedtuple('ReplayResponse', ['status_code', 'content', 'headers', 'elapsed'])
+
+
+def capture_path(capture_dir, feed_id, timestamp):
+    return os.path.join(capture_dir, feed_id, f'{timestamp}.pb')
+
+
+def url_feed_id(url):
+    # e.g. gtfs-bdfm
+    return unquote(urlparse(url).path).split('/')[-1]
+
+
+class VirtualClock:
+    # datetime.now and time.monotonic for a replay, running speed times faster than real time from start
+    def __init__(self, start, speed=1):
+        self.start = start
+        self.speed = speed
+        self.real_start = time.monotonic()
+
+    def monotonic(self):
+        return (time.monotonic() - self.real_start) * self.speed
+
+    def now(self):
+        return self.start + timedelta(seconds=self.monotonic())
+
+
+class ReplayEngine:
+    def __init__(self, capture_dir, speed=1):
+        # feed_id -> sorted capture timestamps
+        self.captures = {}
+        for path in glob.glob(capture_path(capture_dir, '*', '*')):
+            name = os.path.basename(path)[:-len('.pb')]
+            if name.isdigit():
+                self.captures.setdefault(os.path.basename(os.path.dirname(path)), []).append(int(name))
+        if not self.captures:
+            raise SystemExit(f'No captured feeds in {capture_dir}, run main.py --capture first')
+        for timestamps in self.captures.values():
+            timestamps.sort()
+
+        self.capture_dir = capture_dir
+        self.start = datetime.fromtimestamp(min(timestamps[0] for timestamps in self.captures.values()))
+        self.end = datetime.fromtimestamp(max(timestamps[-1] for timestamps in self.captures.values()))
+        self.clock = VirtualClock(self.start, speed)
+
+    def get(self, url, headers=None, params=None):
+        return self.respond(url, headers)
+
+    def get_many(self, requests):
+        return [self.respond(request.url, request.headers) for request in requests]
+
+    def respond(self, url, headers=None):
+        feed_id = url_feed_id(url)
+        timestamps = self.captures.get(feed_id)
+        if timestamps is None:
+            return ReplayResponse(404, f'No captures of {feed_id}'.encode(), {}, timedelta(0))
+
+        captured = bisect_right(timestamps, self.clock.now().timestamp())
+        if not captured:
+            # nothing captured yet at this point of the replay
+            return ReplayResponse(304, b'', {}, timedelta(0))
+        timestamp = timestamps[captured - 1]
+        etag = f'"{timestamp}"'
+        if headers and headers.get('If-None-Match') == etag:
+            return ReplayResponse(304, b'', {'ETag': etag}, timedelta(0))
+
+        start = time.perf_counter()
+        with open(capture_path(self.capture_dir, feed_id, timestamp), 'rb') as fp:
+            content = fp.read()
+        return ReplayResponse(200, content, {'ETag': etag}, timedelta(seconds=time.perf_counter() - start))
+
+    def close(self):
+        pass
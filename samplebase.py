@@ -4,11 +4,19 @@ import os
 import time
 import sys
 
-if os.name == 'nt':
-    RGBMatrix = getattr(importlib.import_module('RGBMatrixEmulator'), 'RGBMatrix')
-    RGBMatrixOptions = getattr(importlib.import_module('RGBMatrixEmulator'), 'RGBMatrixOptions')
-else:
-    from rgbmatrix import RGBMatrix, RGBMatrixOptions
+# the emulator on Windows, the panel everywhere else, --headless for the in-memory canvas in headless.py
+BACKENDS = {
+    'rgbmatrix': 'rgbmatrix',
+    'emulator': 'RGBMatrixEmulator',
+    'headless': 'headless',
+}
+DEFAULT_BACKEND = 'emulator' if os.name == 'nt' else 'rgbmatrix'
+
+
+def load_backend(name):
+    # (RGBMatrix, RGBMatrixOptions) from the backend's module, imported only once it's chosen
+    module = importlib.import_module(BACKENDS[name])
+    return module.RGBMatrix, module.RGBMatrixOptions
 
 
 class SampleBase(object):
@@ -34,6 +42,7 @@ class SampleBase(object):
         self.parser.add_argument("--led-panel-type", action="store", help="Needed to initialize special panels. Supported: 'FM6126A'", default="", type=str)
         self.parser.add_argument("--led-no-drop-privs", dest="drop_privileges", help="Don't drop privileges from 'root' after initializing the hardware.", action='store_false')
         self.parser.add_argument("--led-limit-refresh", action="store", help="Hz. Default: 0", default=0, type=int)
+        self.parser.add_argument("--headless", action="store_true", help="Render to an in-memory canvas instead of the panel")
         self.parser.set_defaults(drop_privileges=True)
 
     def usleep(self, value):
@@ -45,6 +54,8 @@ class SampleBase(object):
     def process(self):
         self.args = self.parser.parse_args()
 
+        self.backend = 'headless' if self.args.headless else DEFAULT_BACKEND
+        RGBMatrix, RGBMatrixOptions = load_backend(self.backend)
         options = RGBMatrixOptions()
 
         if self.args.led_gpio_mapping != None:
@@ -61,7 +72,7 @@ class SampleBase(object):
         options.led_rgb_sequence = self.args.led_rgb_sequence
         options.pixel_mapper_config = self.args.led_pixel_mapper
         options.panel_type = self.args.led_panel_type
-        if os.name != 'nt':
+        if self.backend != 'emulator':
             options.limit_refresh_rate_hz = self.args.led_limit_refresh
 
         if self.args.led_show_refresh:
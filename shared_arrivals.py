@@ -0,0 +1,214 @@
+from datetime import datetime
+import math
+from multiprocessing import shared_memory
+import os
+import time
+
+import numpy as np
+
+# A fixed layout table of the next arrivals at each stop, written by the fetcher process and read
+# by the display process through shared memory, so parsing the feeds never holds up a frame.
+#
+# The writer makes the sequence counter odd while it copies a new table in and even again once
+# it's done. A reader copies the table out and only keeps the copy if the counter was the same
+# even number before and after.
+#
+# The same table is saved to disk after each refresh (ArrivalsFile), so a restart has arrivals to
+# show before anything is fetched or parsed.
+
+HEADER_DTYPE = np.dtype([('sequence', '<u8'), ('timestamp', '<f8')])
+SLOT_DTYPE = np.dtype([
+    ('time', '<f8'),
+    ('last_position_update', '<f8'),
+    ('route_id', 'S4'),
+    ('headsign_text', 'S36'),
+])
+
+# how long a reader waits for a write in progress to finish, and how long before it gives up on a
+# writer that died part way through
+READ_RETRY_INTERVAL = 0.001
+READ_TIMEOUT = 0.5
+
+
+class Train:
+    # the parts of an nyct_gtfs Trip the display needs, taken out once when a feed is indexed so the
+    # Trip and the protobuf messages behind it can be freed, and rebuilt from the table. The stop's
+    # direction comes from the config, the arrival time is in the Arrival
+    __slots__ = ('route_id', 'headsign_text', 'last_position_update')
+
+    def __init__(self, route_id, headsign_text, last_position_update):
+        self.route_id = route_id
+        self.headsign_text = headsign_text
+        self.last_position_update = last_position_update
+
+    @classmethod
+    def from_trip(cls, trip):
+        # each of these is worked out from the protobuf messages on every access
+        return cls(trip.route_id, trip.headsign_text, trip.last_position_update)
+
+    def fields(self):
+        return self.route_id, self.headsign_text, self.last_position_update
+
+    def __eq__(self, other):
+        return isinstance(other, Train) and self.fields() == other.fields()
+
+    def __hash__(self):
+        return hash(self.fields())
+
+    def __repr__(self):
+        return f'Train({self.route_id!r}, {self.headsign_text!r}, {self.last_position_update!r})'
+
+
+class ArrivalsTable:
+    # stop_ids x depth arrival slots after a header, laid out over a buffer
+    def __init__(self, stop_ids, depth, no_arrival):
+        self.stop_ids = tuple(stop_ids)
+        self.depth = depth
+        # the time of an arrival that isn't coming, stored as infinity
+        self.no_arrival = no_arrival
+        num_stops = len(self.stop_ids)
+        self.size = HEADER_DTYPE.itemsize + num_stops * 8 + num_stops * depth * SLOT_DTYPE.itemsize
+
+    def encode_time(self, t):
+        if t is None:
+            return math.nan
+        if t == self.no_arrival:
+            return math.inf
+        return t.timestamp()
+
+    def decode_time(self, seconds):
+        if math.isnan(seconds):
+            return None
+        if math.isinf(seconds):
+            return self.no_arrival
+        return datetime.fromtimestamp(seconds)
+
+    def views(self, buffer):
+        # the header, counts and slots in buffer
+        num_stops = len(self.stop_ids)
+        offset = 0
+        header = np.ndarray((), dtype=HEADER_DTYPE, buffer=buffer, offset=offset)
+        offset += HEADER_DTYPE.itemsize
+        counts = np.ndarray((num_stops,), dtype='<i8', buffer=buffer, offset=offset)
+        offset += num_stops * 8
+        slots = np.ndarray((num_stops, self.depth), dtype=SLOT_DTYPE, buffer=buffer, offset=offset)
+        return header, counts, slots
+
+    def encode(self, arrivals):
+        # arrivals is stop_id -> (time, trip) pairs sorted by time, as in FeedSnapshot.arrivals
+        counts = np.zeros(len(self.stop_ids), dtype='<i8')
+        slots = np.zeros((len(self.stop_ids), self.depth), dtype=SLOT_DTYPE)
+        for stop_ind, stop_id in enumerate(self.stop_ids):
+            entries = arrivals.get(stop_id, ())[:self.depth]
+            counts[stop_ind] = len(entries)
+            for slot_ind, (t, trip) in enumerate(entries):
+                slots[stop_ind, slot_ind] = (
+                    self.encode_time(t),
+                    self.encode_time(trip.last_position_update),
+                    trip.route_id.encode(),
+                    # nyct_gtfs has no headsign for a trip whose last stop it doesn't know
+                    (trip.headsign_text or '').encode()[:SLOT_DTYPE['headsign_text'].itemsize],
+                )
+        return counts, slots
+
+    def decode(self, timestamp, counts, slots):
+        # (timestamp, stop_id -> ((time, Train), ...))
+        arrivals = {}
+        for stop_ind, stop_id in enumerate(self.stop_ids):
+            arrivals[stop_id] = tuple(
+                (self.decode_time(slot['time']),
+                 Train(route_id=slot['route_id'].decode(),
+                       # a long headsign may have been cut mid character
+                       headsign_text=slot['headsign_text'].decode(errors='ignore'),
+                       last_position_update=self.decode_time(slot['last_position_update'])))
+                for slot in slots[stop_ind, :counts[stop_ind]])
+        return datetime.fromtimestamp(timestamp), arrivals
+
+
+class SharedArrivals(ArrivalsTable):
+    # the table in a shared memory block, name attaches to an existing block
+    def __init__(self, stop_ids, depth, no_arrival, name=None):
+        super(SharedArrivals, self).__init__(stop_ids, depth, no_arrival)
+        self.shm = shared_memory.SharedMemory(name=name, create=name is None, size=self.size)
+        self.name = self.shm.name
+        self.header, self.counts, self.slots = self.views(self.shm.buf)
+
+    def __reduce__(self):
+        # a spawned fetcher process attaches to the same block by name
+        return SharedArrivals, (self.stop_ids, self.depth, self.no_arrival, self.name)
+
+    def write(self, timestamp, arrivals):
+        # everything is encoded up front so the counter is odd for as short a time as possible
+        counts, slots = self.encode(arrivals)
+        if self.header['sequence'] & 1:
+            # the last writer died part way through a write, put the counter back on even
+            self.header['sequence'] += 1
+        self.header['sequence'] += 1
+        self.counts[:] = counts
+        self.slots[:] = slots
+        self.header['timestamp'] = timestamp.timestamp()
+        self.header['sequence'] += 1
+
+    def read(self):
+        # (timestamp, stop_id -> ((time, Train), ...)) or None if nothing has been written yet, or
+        # a write didn't finish within READ_TIMEOUT
+        deadline = time.monotonic() + READ_TIMEOUT
+        while True:
+            sequence = int(self.header['sequence'])
+            if sequence == 0 or time.monotonic() > deadline:
+                return None
+            if sequence & 1:
+                time.sleep(READ_RETRY_INTERVAL)
+                continue
+            timestamp = float(self.header['timestamp'])
+            counts = self.counts.copy()
+            slots = self.slots.copy()
+            if int(self.header['sequence']) == sequence:
+                break
+        return self.decode(timestamp, counts, slots)
+
+    def close(self):
+        # numpy views hold on to the buffer, drop them before closing it
+        self.header = self.counts = self.slots = None
+        self.shm.close()
+
+    def unlink(self):
+        self.shm.unlink()
+
+
+class ArrivalsFile(ArrivalsTable):
+    # the table in a file, after a line naming the stops and depth it's for. written to a temporary
+    # file and renamed into place, so it's always a whole table
+    def __init__(self, path, stop_ids, depth, no_arrival):
+        super(ArrivalsFile, self).__init__(stop_ids, depth, no_arrival)
+        self.path = path
+        self.key = (' '.join(self.stop_ids) + f' {depth}\n').encode()
+
+    def write(self, timestamp, arrivals):
+        buffer = bytearray(self.size)
+        header, counts, slots = self.views(buffer)
+        counts[:], slots[:] = self.encode(arrivals)
+        header['timestamp'] = timestamp.timestamp()
+        # numpy views hold on to the buffer
+        del header, counts, slots
+
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'wb') as fp:
+            fp.write(self.key)
+            fp.write(buffer)
+        os.replace(tmp_path, self.path)
+
+    def read(self):
+        # (timestamp, stop_id -> ((time, Train), ...)), or None if there's no table for these stops
+        try:
+            with open(self.path, 'rb') as fp:
+                if fp.readline() != self.key:
+                    return None
+                buffer = fp.read()
+        except FileNotFoundError:
+            return None
+        if len(buffer) != self.size:
+            return None
+        header, counts, slots = self.views(buffer)
+        return self.decode(float(header['timestamp']), counts, slots)
@@ -0,0 +1,316 @@
+from collections import deque, namedtuple, OrderedDict
+import time
+
+import numpy as np
+from PIL import Image
+
+from metrics import METRICS
+
+# Pixels that only change when the trains do (route bullets, row numbers, station headers...) are
+# rasterised once from the BDF fonts into sprites. Frames are composed from them in an offscreen
+# numpy buffer and handed to the canvas with a single SetImage, instead of dozens of
+# graphics.DrawLine / DrawText calls.
+
+Glyph = namedtuple('Glyph', ['device_width', 'width', 'height', 'x_offset', 'y_offset', 'rows'])
+
+# half width of each line of a route bullet, from 6 pixels above its centre to 6 below
+BULLET_HALF_WIDTHS = (1, 3, 4, 5, 5, 6, 6, 6, 5, 5, 4, 3, 1)
+
+REPLACEMENT_CHARACTER = 0xFFFD
+
+# plenty for every row, header and clock label without growing forever as the date changes
+SPRITE_CACHE_SIZE = 512
+# seconds of frames the achieved fps is averaged over
+FPS_WINDOW = 10
+
+
+def rgb(colour):
+    # graphics.Color -> (r, g, b)
+    return colour.red, colour.green, colour.blue
+
+
+class BdfFont:
+    # the glyph bitmaps of a .bdf font, laid out the way rgbmatrix's graphics.DrawText draws them
+    def __init__(self, path):
+        self.path = path
+        self.glyphs = {}
+        self.masks = {}
+        self.load(path)
+
+    def load(self, path):
+        encoding = None
+        device_width = 0
+        bbx = None
+        rows = None
+        with open(path) as fp:
+            for line in fp:
+                fields = line.split()
+                if not fields:
+                    continue
+                keyword = fields[0]
+                if keyword == 'ENCODING':
+                    encoding = int(fields[1])
+                elif keyword == 'DWIDTH':
+                    device_width = int(fields[1])
+                elif keyword == 'BBX':
+                    bbx = [int(field) for field in fields[1:5]]
+                elif keyword == 'BITMAP':
+                    rows = []
+                elif keyword == 'ENDCHAR':
+                    width, height, x_offset, y_offset = bbx
+                    self.glyphs[encoding] = Glyph(device_width, width, height, x_offset, y_offset, tuple(rows))
+                    rows = None
+                elif rows is not None:
+                    # rows are padded out to whole bytes, keep just the glyph's width
+                    rows.append(int(keyword, 16) >> (4 * len(keyword) - bbx[0]))
+
+    def glyph(self, codepoint):
+        glyph = self.glyphs.get(codepoint)
+        if glyph is None:
+            glyph = self.glyphs.get(REPLACEMENT_CHARACTER)
+        return glyph
+
+    def character_width(self, codepoint):
+        glyph = self.glyph(codepoint)
+        if glyph is None:
+            return -1
+        return glyph.device_width
+
+    def text_width(self, text):
+        return sum(max(self.character_width(ord(letter)), 0) for letter in text)
+
+    def glyph_mask(self, glyph):
+        # the glyph as a height x device_width boolean array, decoded on first use
+        mask = self.masks.get(glyph)
+        if mask is None:
+            mask = np.zeros((glyph.height, max(glyph.device_width, 0)), dtype=bool)
+            for row_ind, bits in enumerate(glyph.rows):
+                for col in range(glyph.width):
+                    pixel_x = glyph.x_offset + col
+                    if bits >> (glyph.width - 1 - col) & 1 and 0 <= pixel_x < glyph.device_width:
+                        mask[row_ind, pixel_x] = True
+            self.masks[glyph] = mask
+        return mask
+
+
+class SpriteBuilder:
+    # collects glyphs and lines in canvas coordinates, later ones drawn over earlier ones
+    def __init__(self):
+        self.masks = []
+
+    def set_pixel(self, x, y, colour):
+        self.masks.append((x, y, np.ones((1, 1), dtype=bool), colour))
+        return self
+
+    def line(self, x0, x1, y, colour):
+        # horizontal lines are all the bullets need
+        self.masks.append((x0, y, np.ones((1, x1 - x0 + 1), dtype=bool), colour))
+        return self
+
+    def text(self, font, x, y, colour, text):
+        for letter in text:
+            glyph = font.glyph(ord(letter))
+            if glyph is None:
+                continue
+            self.masks.append((x, y - glyph.height - glyph.y_offset, font.glyph_mask(glyph), colour))
+            x += glyph.device_width
+        return self
+
+    def bitmap(self, x, y, mask, colour):
+        self.masks.append((x, y, mask, colour))
+        return self
+
+    def bullet(self, x, y, colour):
+        for dy, half_width in enumerate(BULLET_HALF_WIDTHS, start=-6):
+            self.line(x - half_width, x + half_width, y + dy, colour)
+        return self
+
+    def build(self):
+        if not self.masks:
+            return Sprite(0, 0, np.zeros((0, 0, 3), dtype=np.uint8), np.zeros((0, 0), dtype=bool))
+
+        left = min(x for x, _, _, _ in self.masks)
+        top = min(y for _, y, _, _ in self.masks)
+        right = max(x + mask.shape[1] for x, _, mask, _ in self.masks)
+        bottom = max(y + mask.shape[0] for _, y, mask, _ in self.masks)
+
+        pixels = np.zeros((bottom - top, right - left, 3), dtype=np.uint8)
+        alpha = np.zeros((bottom - top, right - left), dtype=bool)
+        for x, y, mask, colour in self.masks:
+            rows = slice(y - top, y - top + mask.shape[0])
+            cols = slice(x - left, x - left + mask.shape[1])
+            pixels[rows, cols][mask] = colour
+            alpha[rows, cols] |= mask
+
+        # glyph boxes include their spacing, crop down to the lit pixels
+        lit_rows = np.flatnonzero(alpha.any(axis=1))
+        lit_cols = np.flatnonzero(alpha.any(axis=0))
+        if not len(lit_rows):
+            return Sprite(0, 0, pixels[:0, :0], alpha[:0, :0])
+        rows = slice(lit_rows[0], lit_rows[-1] + 1)
+        cols = slice(lit_cols[0], lit_cols[-1] + 1)
+        return Sprite(left + lit_cols[0], top + lit_rows[0], pixels[rows, cols], alpha[rows, cols])
+
+
+class Sprite:
+    # a block of pixels with an alpha mask, blitted onto a FrameBuffer at x, y
+    def __init__(self, x, y, pixels, alpha):
+        self.x = int(x)
+        self.y = int(y)
+        self.height, self.width = alpha.shape
+        # premultiplied so compositing is one multiply-add per pixel
+        alpha = alpha.astype(np.uint16)[:, :, None] * 255
+        self.premultiplied = pixels.astype(np.uint16) * alpha
+        self.inverse_alpha = 255 - alpha
+
+    def overlaps(self, other):
+        return (self.x < other.x + other.width and other.x < self.x + self.width and
+                self.y < other.y + other.height and other.y < self.y + self.height)
+
+
+class SpriteCache:
+    # least recently used sprites are dropped once there are more than size of them
+    def __init__(self, size=SPRITE_CACHE_SIZE):
+        self.size = size
+        self.sprites = OrderedDict()
+
+    def get(self, key, build):
+        sprite = self.sprites.get(key)
+        if sprite is None:
+            sprite = build()
+            self.sprites[key] = sprite
+            if len(self.sprites) > self.size:
+                self.sprites.popitem(last=False)
+        else:
+            self.sprites.move_to_end(key)
+        return sprite
+
+    def text(self, font, x, y, colour, text):
+        return self.get(('text', font.path, x, y, colour, text),
+                        lambda: SpriteBuilder().text(font, x, y, colour, text).build())
+
+
+class Frame:
+    # the sprites making up one frame, in drawing order
+    def __init__(self):
+        self.sprites = []
+
+    def add(self, sprite):
+        self.sprites.append(sprite)
+
+
+class FrameBuffer:
+    # an offscreen height x width x 3 frame, pushed to the canvas in one SetImage
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        self.pixels = np.zeros((height, width, 3), dtype=np.uint8)
+
+    def clip(self, x, y, width, height):
+        # (target rows, target cols), (source rows, source cols) or None when off screen
+        left = max(x, 0)
+        top = max(y, 0)
+        right = min(x + width, self.width)
+        bottom = min(y + height, self.height)
+        if left >= right or top >= bottom:
+            return None
+        return ((slice(top, bottom), slice(left, right)),
+                (slice(top - y, bottom - y), slice(left - x, right - x)))
+
+    def fill(self, x, y, width, height, colour=(0, 0, 0)):
+        region = self.clip(x, y, width, height)
+        if region is not None:
+            (rows, cols), _ = region
+            self.pixels[rows, cols] = colour
+
+    def clear(self):
+        self.pixels[:] = 0
+
+    def blit(self, sprite):
+        region = self.clip(sprite.x, sprite.y, sprite.width, sprite.height)
+        if region is None:
+            return
+        (rows, cols), (sprite_rows, sprite_cols) = region
+        target = self.pixels[rows, cols]
+        target[:] = (sprite.premultiplied[sprite_rows, sprite_cols] +
+                     target * sprite.inverse_alpha[sprite_rows, sprite_cols]) // 255
+
+    def push(self, canvas):
+        canvas.SetImage(Image.fromarray(self.pixels, 'RGB'), 0, 0)
+
+
+class FrameRenderer:
+    # composes frames in a FrameBuffer, only clearing and reblitting the sprites that changed, and
+    # doesn't push or swap a frame that matches what is already on screen
+    def __init__(self, matrix, on_first_frame=None):
+        self.matrix = matrix
+        # called once the first frame has been swapped onto the panel
+        self.on_first_frame = on_first_frame
+        self.framebuffer = None
+        # sprites in the framebuffer and on screen, None when unknown
+        self.shown = None
+        # when recent frames were asked for, for the achieved fps
+        self.frame_times = deque()
+
+    def invalidate(self):
+        # something drew on the canvas behind our back
+        self.shown = None
+
+    def count_frame(self):
+        now = time.monotonic()
+        self.frame_times.append(now)
+        while self.frame_times[0] < now - FPS_WINDOW:
+            self.frame_times.popleft()
+        METRICS.count('frames_total')
+        span = now - self.frame_times[0]
+        METRICS.set('display_fps', (len(self.frame_times) - 1) / span if span > 0 else 0)
+
+    def show(self, canvas, frame):
+        self.count_frame()
+        sprites = tuple(frame.sprites)
+        if sprites == self.shown:
+            METRICS.count('frames_skipped_total')
+            return canvas
+
+        start = time.perf_counter()
+
+        framebuffer = self.framebuffer
+        if framebuffer is None or (framebuffer.width, framebuffer.height) != (canvas.width, canvas.height):
+            framebuffer = self.framebuffer = FrameBuffer(canvas.width, canvas.height)
+            self.shown = None
+
+        if self.shown is not None:
+            # sprites kept from the last frame but stacked differently can't be patched up in place
+            wanted = set(sprites)
+            shown = set(self.shown)
+            if [sprite for sprite in self.shown if sprite in wanted] != [sprite for sprite in sprites if sprite in shown]:
+                self.shown = None
+
+        if self.shown is None:
+            framebuffer.clear()
+            for sprite in sprites:
+                framebuffer.blit(sprite)
+        else:
+            cleared = [sprite for sprite in self.shown if sprite not in wanted]
+            for sprite in cleared:
+                framebuffer.fill(sprite.x, sprite.y, sprite.width, sprite.height)
+            # anything under a cleared or newly added sprite has to be blitted again, in order, and
+            # so does anything above a sprite blitted again
+            dirty = cleared + [sprite for sprite in sprites if sprite not in shown]
+            for sprite in sprites:
+                if sprite not in shown:
+                    framebuffer.blit(sprite)
+                elif any(sprite.overlaps(other) for other in dirty):
+                    framebuffer.blit(sprite)
+                    dirty.append(sprite)
+
+        framebuffer.push(canvas)
+        self.shown = sprites
+        swap_start = time.perf_counter()
+        canvas = self.matrix.SwapOnVSync(canvas)
+        METRICS.observe('frame_render_seconds', swap_start - start)
+        METRICS.observe('frame_swap_seconds', time.perf_counter() - swap_start)
+        if self.on_first_frame is not None:
+            self.on_first_frame()
+            self.on_first_frame = None
+        return canvas
@@ -0,0 +1,191 @@
+from collections import namedtuple
+from datetime import datetime, time as dt_time, timedelta
+import os
+import threading
+import time
+import warnings
+
+import numpy as np
+from PIL import Image
+
+# OpenWeatherMap observations and forecasts for the clock and weather screens. Everything the screens
+# show is worked out once per fetch, and fetching happens on a background thread so a screen never
+# waits on the network.
+
+OWM_WEATHER_URL = 'https://api.openweathermap.org/data/2.5/weather'
+OWM_FORECAST_URL = 'https://api.openweathermap.org/data/2.5/forecast'
+
+# how long a fetch is good for, and the least time between two attempts when OpenWeatherMap is failing
+WEATHER_TTL = 4 * 3600
+WEATHER_RETRY_INTERVAL = 600
+
+# evening is 6pm to midnight, tomorrow's icon is for the early afternoon
+EVENING_START = dt_time(18, 0)
+EVENING_ICON_TIME = dt_time(20, 0)
+TOMORROW_ICON_TIME = dt_time(13, 0)
+
+# OpenWeatherMap weather codes, see https://openweathermap.org/weather-conditions
+WEATHER_ICON_CODES = (
+    # (codes, day icon, night icon)
+    ((201, 202), 'rain_lightning', 'rain_lightning'),
+    ((200, 210, 211, 212, 221, 230, 231, 232), 'lightning', 'lightning'),
+    ((300, 301, 302, 310, 311, 312, 313, 314, 321), 'rain0', 'rain0'),
+    ((500, 501), 'rain1', 'rain1'),
+    ((502, 503, 504), 'rain2', 'rain2'),
+    ((511, 611, 612, 613, 615, 616), 'rain_snow', 'rain_snow'),
+    ((520, 521, 522, 531), 'rain1_sun', 'rain1_moon'),
+    ((600, 601, 602), 'snow', 'snow'),
+    ((620, 621, 622), 'snow_sun', 'snow_moon'),
+    ((701, 711, 721, 731, 741, 751, 761, 762, 771, 781), 'cloud_wind', 'cloud_wind'),
+    ((800,), 'sun', 'moon'),
+    ((801,), 'cloud_sun', 'cloud_moon'),
+    ((802,), 'cloud', 'cloud'),
+    ((803, 804), 'clouds', 'clouds'),
+)
+# weather code -> (day icon file, night icon file)
+WEATHER_ICONS = {code: (f'icons/32/{day}.xbm', f'icons/32/{night}.xbm')
+                 for codes, day, night in WEATHER_ICON_CODES for code in codes}
+DEFAULT_ICON = 'icons/32/sun.xbm'
+
+Forecast = namedtuple('Forecast', ['min_temp', 'max_temp', 'icon_file'])
+WeatherState = namedtuple('WeatherState', ['fetched_at', 'temp', 'icon_file', 'today', 'evening', 'tomorrow'])
+
+
+def k_to_c(k):
+    return round(k - 273.15)
+
+
+def weather_to_icon(weather):
+    is_day = weather.weather_icon_name.endswith('d')
+    day_icon, night_icon = WEATHER_ICONS.get(weather.weather_code, (DEFAULT_ICON, DEFAULT_ICON))
+    return day_icon if is_day else night_icon
+
+
+def check_icons():
+    missing = sorted({icon_file for icons in WEATHER_ICONS.values() for icon_file in icons
+                      if not os.path.exists(icon_file)})
+    if missing:
+        raise FileNotFoundError(f'Missing weather icons: {", ".join(missing)}')
+
+
+def load_icons():
+    # every icon weather_to_icon can return, decoded once into a boolean mask
+    check_icons()
+    icon_files = {icon_file for icons in WEATHER_ICONS.values() for icon_file in icons}
+    icon_files.add(DEFAULT_ICON)
+    icons = {}
+    for icon_file in sorted(icon_files):
+        with Image.open(icon_file) as image:
+            icons[icon_file] = np.array(image.convert('1'), dtype=bool)
+    return icons
+
+
+def forecast_for(weathers, icon_time):
+    # min/max over the 3h forecasts in weathers, with the icon from the one closest to icon_time
+    if not weathers:
+        return None
+
+    min_temp = min(k_to_c(weather.temp['temp_min']) for _, weather in weathers)
+    max_temp = max(k_to_c(weather.temp['temp_max']) for _, weather in weathers)
+    _, icon_weather = min(weathers, key=lambda entry: abs((entry[0] - icon_time).total_seconds()))
+    return Forecast(min_temp, max_temp, weather_to_icon(icon_weather))
+
+
+def build_weather_state(current, forecast_weathers, now, fetched_at):
+    # local time of each 3h forecast
+    weathers = [(weather.reference_time('date').astimezone().replace(tzinfo=None), weather)
+                for weather in forecast_weathers]
+    today = now.date()
+    tomorrow = today + timedelta(days=1)
+
+    temp = k_to_c(current.temp['temp'])
+    icon_file = weather_to_icon(current)
+
+    # today always includes the current conditions, even late in the evening
+    todays = [(when, weather) for when, weather in weathers if when.date() == today]
+    today_forecast = forecast_for(todays, now)
+    if today_forecast is None:
+        today_forecast = Forecast(temp, temp, icon_file)
+    else:
+        today_forecast = Forecast(min(today_forecast.min_temp, temp), max(today_forecast.max_temp, temp), icon_file)
+
+    evening = [(when, weather) for when, weather in todays if when.time() >= EVENING_START]
+    evening_forecast = forecast_for(evening, datetime.combine(today, EVENING_ICON_TIME))
+    if evening_forecast is None:
+        evening_forecast = today_forecast
+
+    tomorrows = [(when, weather) for when, weather in weathers if when.date() == tomorrow]
+    tomorrow_forecast = forecast_for(tomorrows, datetime.combine(tomorrow, TOMORROW_ICON_TIME))
+
+    return WeatherState(fetched_at=fetched_at,
+                        temp=temp,
+                        icon_file=icon_file,
+                        today=today_forecast,
+                        evening=evening_forecast,
+                        tomorrow=tomorrow_forecast)
+
+
+class WeatherService:
+    # serves the last fetched WeatherState straight away and, once it is older than the ttl, fetches a new
+    # one in the background (stale-while-revalidate). Fetches go through get_engine(), a fetch.FetchEngine
+    # shared with the subway feeds, and are parsed with pyowm. Without an api_key there is no weather.
+    def __init__(self, api_key=None, get_engine=None, place='New York', ttl=WEATHER_TTL,
+                 retry_interval=WEATHER_RETRY_INTERVAL):
+        self.api_key = api_key
+        self.get_engine = get_engine
+        self.place = place
+        self.ttl = ttl
+        self.retry_interval = retry_interval
+        # only ever replaced wholesale, so readers don't need the lock
+        self.state = None
+        self.last_attempt = None
+        self.refreshing = threading.Lock()
+
+    def get(self):
+        # the latest WeatherState, possibly stale, or None if we've never had one
+        state = self.state
+        if self.api_key is not None and self.due(state):
+            self.refresh_in_background()
+        return state
+
+    def due(self, state):
+        now = time.monotonic()
+        if self.last_attempt is not None and now - self.last_attempt < self.retry_interval:
+            return False
+        return state is None or now - state.fetched_at > self.ttl
+
+    def refresh_in_background(self):
+        if not self.refreshing.acquire(blocking=False):
+            # already on it
+            return
+        self.last_attempt = time.monotonic()
+        threading.Thread(target=self.refresh_and_release, name='weather-refresher', daemon=True).start()
+
+    def refresh_and_release(self):
+        try:
+            self.refresh()
+        except Exception as e:
+            # fetch errors, bad responses and pyowm raise all sorts, keep serving the old state and try again after the retry interval
+            warnings.warn(f'Weather refresh failed: {e}')
+        finally:
+            self.refreshing.release()
+
+    def refresh(self):
+        from fetch import Request
+        from pyowm.weatherapi25.forecast import Forecast as OWMForecast
+        from pyowm.weatherapi25.observation import Observation
+
+        # the observation and the 3h forecast are fetched together
+        params = {'q': self.place, 'appid': self.api_key}
+        responses = self.get_engine().get_many([Request(OWM_WEATHER_URL, params=params),
+                                                Request(OWM_FORECAST_URL, params=params)])
+        for response in responses:
+            if isinstance(response, Exception):
+                raise response
+            response.raise_for_status()
+        weather_response, forecast_response = responses
+
+        current = Observation.from_dict(weather_response.json()).weather
+        forecast = OWMForecast.from_dict(forecast_response.json())
+        self.state = build_weather_state(current, forecast.weathers, datetime.now(), time.monotonic())
+        return self.state